@@ -1,3 +1,4 @@
+import click
 import os
 import time
 import traceback
@@ -5,19 +6,42 @@ import traceback
 from dotenv import load_dotenv
 load_dotenv()
 
-from config import categories_list, status_list, horizon_server
+from config import IMAGE_MAX_SIDE, IMAGE_MAX_UPLOAD_SIZE, INGEST_PAYMENTS, categories_list, status_list
+from db import close_db, fragment_cache_stats, query_cache_stats, run_migrations
 from flask import Flask, jsonify, make_response, redirect, render_template, request, session, url_for
 
 from stellar_sdk.exceptions import BadResponseError, BadRequestError
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from helpers import *
 
 app = Flask(__name__)
 
+# Refuse larger requests from their Content-Length, before reading the body (413 Request Entity Too Large)
+app.config["MAX_CONTENT_LENGTH"] = 2 * IMAGE_MAX_UPLOAD_SIZE
+
 # Configure your secret key and admin account in the .env file
 app.secret_key = os.environ.get('SECRET_KEY')
 admin_account = os.environ.get('ADMIN_ACCOUNT')
 
+# Give each request's pooled database connection back when the request ends
+app.teardown_appcontext(close_db)
+
+# Bring the database schema and settings up to date before serving requests
+run_migrations()
+
+
+@app.before_request
+def start_background_workers():
+    """
+    Starts the expiry scheduler, the submission workers (resuming unfinished batches)
+    and the payment ingester, if enabled, in each worker process serving requests.
+    """
+    start_expiry_scheduler()
+    start_submission_workers()
+    if INGEST_PAYMENTS:
+        start_payment_ingester()
+
 
 @app.context_processor
 def global_variables():
@@ -25,20 +49,35 @@ def global_variables():
     return dict(
         categories_list=categories_list,
         status_list=status_list,
-        admin_account=admin_account
+        admin_account=admin_account,
+        image_sources=image_sources,
+        project_cards=project_cards
     )
 
 
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """ Adds the content fingerprint to static file URLs, so they can be cached until the file changes """
+    if endpoint == "static" and "v" not in values:
+        fingerprint = static_fingerprint(values.get("filename", ""))
+        if fingerprint:
+            values["v"] = fingerprint
+
+
 @app.after_request
 def after_request(response):
-    """Ensure responses aren't cached"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
-    return response
+    """ Applies the caching policy (see cache_control) """
+    return cache_control(response)
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """ Explains requests refused because of MAX_CONTENT_LENGTH (an image that is too large) """
+    return handle_response(f"Invalid image: files larger than {IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024)}MB are not allowed."), 413
 
 
 @app.route("/", methods=["GET", "POST"])
+@conditional_page(projects_version)
 def index():
     """
     Displays homepage and deals with connecting Freighter wallet.
@@ -69,12 +108,19 @@ def index():
             print(str(e))
             return handle_response("Internal server error.")
 
-    projects_list = search_projects(status="active")
+    # First page of active projects (next pages are loaded on scroll) and info cards totals
+    search_filters = {"status": "active"}
+    projects_list, next_cursor = search_projects_page(**search_filters)
+    projects_summary = summarize_projects(**search_filters)
 
     end_time_total = time.time()
     print(f"Time tracking: {end_time_total - start_time_total} sec")
 
-    return render_template("index.html", projects_list=projects_list)
+    return render_template("index.html",
+                           projects_list=projects_list,
+                           next_cursor=next_cursor,
+                           projects_summary=projects_summary,
+                           search_filters=search_filters)
 
 
 @app.route("/logout")
@@ -97,17 +143,18 @@ def faq():
 
 
 @app.route("/projects", methods=["GET", "POST"])
+@conditional_page(projects_version)
 def projects():
     """
     Displays projects page with a list of all projects.
 
-    GET method: displays full projects list.
+    GET method: displays the first page of the projects list (next pages are loaded on scroll).
 
     Returns:
         GET: renders projects.html.
     """
-    projects_list = search_projects() 
-    return render_template("projects.html", projects_list=projects_list)
+    projects_list, next_cursor = search_projects_page()
+    return render_template("projects.html", projects_list=projects_list, next_cursor=next_cursor)
 
 
 @app.route("/filter_projects", methods=["POST"])
@@ -136,23 +183,37 @@ def filter_projects():
         if project_search["status"] == "all":
             project_search["status"] = ""
 
-        # Search projects with the filters inputed by the user
-        projects_list = search_projects(project_search["name"], project_search["category"], project_search["status"])
-
         # Get origin page (search bar is a template shared by multiple pages)
         parent_page = request.form.get("parent_page")
-        
-        # Filter only current user's projects for My Projects page
-        if parent_page == "my_projects.html" and session["public_key"] != admin_account:
-            projects_list = [project for project in projects_list if project["public_key"] == session["public_key"]]
 
-        return render_template(parent_page, projects_list=projects_list)
+        # Search only current user's projects for My Projects page
+        owner = ""
+        if parent_page == "my_projects.html" and session.get("public_key") != admin_account:
+            owner = session["public_key"]
+            project_search["mine"] = 1
+
+        # Search the first page of projects with the filters inputed by the user
+        projects_list, next_cursor = search_projects_page(
+            project_search["name"], project_search["category"], project_search["status"], owner)
+
+        # Admin tabs and info cards need every fundable/refundable project and the totals
+        admin_context = {}
+        if parent_page == "control_panel.html":
+            admin_context = search_admin_projects(
+                project_search["name"], project_search["category"], project_search["status"])
+
+        return render_template(parent_page,
+                               projects_list=projects_list,
+                               next_cursor=next_cursor,
+                               search_filters=project_search,
+                               **admin_context)
     except Exception as e:
         print(str(e))
         return handle_response("Error filtering projects.")
 
 
 @app.route("/project/<int:project_id>", methods=["GET", "POST"])
+@conditional_page(project_version)
 def project_page(project_id):
     """
     Displays details of a specific project and allows the owner to cancel it.
@@ -166,7 +227,8 @@ def project_page(project_id):
     """
 
     try:
-        project = search_project_by_id(project_id)
+        # Canceling decides whether donors are refunded, so it reads the donations directly from the database
+        project = search_project_by_id(project_id, cache=request.method != "POST")
     except Exception as e:
         print(str(e))
         return handle_response(str(e))
@@ -209,11 +271,13 @@ def my_projects():
     if session["public_key"] == admin_account:
         return redirect("/control_panel")
     
-    # Search and filter only projects owned by the user
-    projects_list = search_projects()
-    projects_list = [project for project in projects_list if project["public_key"] == session["public_key"]]
+    # Search only projects owned by the user (first page, next pages are loaded on scroll)
+    projects_list, next_cursor = search_projects_page(owner=session["public_key"])
 
-    return render_template("my_projects.html", projects_list=projects_list)
+    return render_template("my_projects.html",
+                           projects_list=projects_list,
+                           next_cursor=next_cursor,
+                           search_filters={"mine": 1})
 
 
 @app.route("/my_donations")
@@ -271,18 +335,23 @@ def new_project():
                 "expire_date": expire_date,
                 "status": "active",
                 "description": request.form.get("projectDescription"),
-                "image": request.form.get("base64Image")
+                "image": request.form.get("base64Image") or request.files.get("imageInput")
             }
             
             # Check for invalid or malicious inputs
             check_input(project)
             
-            # Upload image in the static folder ang get url
-            file_url = upload_image(project["image"], app)
+            # Upload image in the static folder ang get url (older pages still send it as a base64 field)
+            if isinstance(project["image"], str):
+                file_url = upload_image(project["image"], app)
+            else:
+                file_url = upload_image_file(project["image"])
 
             # Insert project info and image url into projects table
             project_id = insert_project_into_database(project, file_url)
             return redirect(url_for("project_page", project_id=project_id))
+        except RequestEntityTooLarge as e:
+            return request_too_large(e)
         except ValueError as e:
             print(str(e))
             return handle_response(f"{str(e)}")
@@ -290,7 +359,7 @@ def new_project():
             print(str(e))
             return handle_response(f"{str(e)}")
 
-    return render_template("new_project.html")
+    return render_template("new_project.html", image_max_upload_size=IMAGE_MAX_UPLOAD_SIZE, image_max_side=IMAGE_MAX_SIDE)
 
 
 @app.route("/edit_project", methods=["POST"])
@@ -339,6 +408,10 @@ def edit_project():
             project["id"])
         
         write_query(query, params)
+
+        # Keep the search bar typeahead in sync with the new name, and the expiry scheduler with the new date
+        update_suggest_index(project["id"], project["name"])
+        wake_expiry_scheduler()
         return redirect(url_for("project_page", project_id=project["id"]))
     except ValueError as e:
         print(str(e))
@@ -369,11 +442,11 @@ def donate():
         project_id = data.get("project_id")
         amount = data.get("amount")
 
-        # Get project info from database
+        # Get project info from database (never cached: another worker process may have just expired it)
         project_data = fetch_query("""
             SELECT status, public_key
             FROM projects WHERE id = ?
-        """, project_id,)[0]
+        """, project_id, cache=False)[0]
 
         # Check if project is active (not expired)
         if project_data["status"] != "active":
@@ -395,8 +468,8 @@ def donate():
             "destination_account": admin_account,
         }]
 
-        # Build the payment transaction and return xdr transaction
-        transaction_xdr = build_payment_transaction(operation_data, "donation")
+        # Build the payment transaction and return xdr transaction (a single operation always fits in one transaction)
+        transaction_xdr = build_payment_transaction(operation_data, "donation")[0]
         return jsonify(transaction_xdr=str(transaction_xdr))
     except Exception as e:
         print(str(e))
@@ -407,43 +480,132 @@ def donate():
 @freighter_required
 def send_transaction():
     """
-    Submits a signed transaction to the Stellar network.
+    Queues signed transactions to be submitted to the Stellar network in the background.
 
-    POST method: receives a signed transaction in JSON format, submits it to the network,
-    and updates the database with the transaction's hash.
+    POST method: receives a signed transaction (or the ordered list of transactions of a split batch) in JSON format
+    and returns right away. A submission worker submits them one by one and updates the database with each
+    transaction's hash, stopping at the first failed transaction (the following ones depend on its sequence number).
 
-    Params (POST form): signed transaction in XDR format.
+    Params (POST form): signed transaction in XDR format, or a list of them.
 
     Returns:
-        Success: JSON response including the transaction submission response.
+        Success: JSON response with the submission id, to poll /api/submissions/<id>.
         Failure: detailed error message.
     """
 
     try:
-        # Retrieve signed transaction from request and submit it to Stellar
-        signed_transaction = request.get_json()
-        submit_response = horizon_server.submit_transaction(signed_transaction)
-
-        if submit_response["successful"] == True:
-            try:
-                # Get transaction hash
-                hash = submit_response["hash"]
-
-                # Insert hash and transaction data into database
-                insert_transaction_into_database(hash)
-                return jsonify(submit_response)
-            except Exception as e:
-                print(str(e))
-                return handle_response(str(e))
+        # Retrieve signed transactions from request
+        signed_transactions = request.get_json()
+        if isinstance(signed_transactions, str):
+            signed_transactions = [signed_transactions]
+
+        submission_id = enqueue_submission(signed_transactions)
+        return jsonify(submission_id=submission_id, status="queued"), 202
 
     except Exception as e:
         print(str(e))
         return handle_response(f"Unexpected error sending transaction: {str(e)}")
-    
 
 
+@app.route("/api/submissions/<submission_id>")
+@freighter_required
+def api_submission(submission_id):
+    """
+    Reports the progress of transactions queued by /send_transaction.
+
+    Params:
+        submission_id (str): the id returned by /send_transaction.
+
+    Returns:
+        JSON with the status ("queued", "submitting", "successful" or "failed"),
+        the hashes of the transactions submitted so far and the error, if any.
+    """
+    batch = get_submission_batch(submission_id)
+
+    # Users can only follow their own submissions
+    if batch is None or batch["public_key"] != session["public_key"]:
+        return jsonify(error="Submission not found."), 404
+
+    return jsonify(
+        submission_id=submission_id,
+        status=batch["status"],
+        hash=", ".join(batch["hashes"]),
+        hashes=batch["hashes"],
+        error=batch["error"]
+    )
+
+
+@app.route("/api/projects")
+@conditional_page(projects_version)
+def api_projects():
+    """
+    Returns the next page of projects, used by the infinite scroll of the projects lists.
+
+    Params (query string): cursor (ID of the last project shown), name, category, status,
+    mine (only current user's projects) and view ("cards" or "rows" for the control panel table).
+
+    Returns:
+        JSON with the projects, their rendered HTML and the cursor of the next page (null on the last page).
+    """
+
+    try:
+        cursor = request.args.get("cursor", type=int)
+        view = request.args.get("view", "cards")
+
+        # Restrict to the current user's projects if requested
+        owner = ""
+        if request.args.get("mine"):
+            if session.get("public_key") is None:
+                return jsonify(error="Wallet not connected."), 401
+            owner = session["public_key"]
+
+        projects_list, next_cursor = search_projects_page(
+            request.args.get("name", "").lower(),
+            request.args.get("category", "").lower(),
+            request.args.get("status", "").lower(),
+            owner,
+            cursor
+        )
+
+        # Render with the same templates as the first page so appended items look the same
+        template = "includes/projects_table_rows.html" if view == "rows" else "includes/project_cards.html"
+        html = render_template(template, projects_list=projects_list)
+
+        return jsonify(projects=projects_list, html=html, next_cursor=next_cursor)
+    except Exception as e:
+        print(str(e))
+        return jsonify(error="Error loading projects."), 500
+
+
+@app.route("/api/search/suggest")
+def search_suggest():
+    """
+    Suggests project names and categories for the search bar while the user types.
+
+    Params (query string): q, the text typed so far.
+
+    Returns:
+        JSON with a list of suggestions (type, name and project_id).
+    """
+    return jsonify(suggestions=suggest_projects(request.args.get("q", "")))
+
 """ ADMIN ROUTES """
 
+@app.route("/api/query_cache")
+@freighter_required
+def query_cache():
+    """
+    Reports the query cache counters of this worker process (admin only).
+
+    Returns:
+        JSON with the cache size and hits, misses, invalidations and evictions counters,
+        and the project cards cache counters under fragment_cache.
+    """
+    if session["public_key"] != admin_account:
+        return jsonify(error="Only an admin can access this page."), 403
+    return jsonify(**query_cache_stats(), fragment_cache=fragment_cache_stats())
+
+
 @app.route("/control_panel", methods=["GET", "POST"])
 @freighter_required
 def control_panel():
@@ -462,8 +624,6 @@ def control_panel():
     if session["public_key"] != admin_account:
         return handle_response("Only an admin can access this page.")
 
-    projects_list = search_projects()
-
     if request.method == "POST":
         admin_action_projects = []
 
@@ -473,9 +633,9 @@ def control_panel():
             request_data = request.get_json()
             selected_projects_ids = [int(id) for id in request_data.get("selected_projects_ids")]
 
-            # Filter only projects that are fundable or refundable
+            # Filter only projects that are fundable or refundable (read fresh, a settled project can't be paid again)
             admin_action_projects = filter_permitted_projects(
-                projects_list,
+                search_projects(status=operation_type, cache=False),
                 selected_projects_ids,
                 operation_type
             )
@@ -488,7 +648,13 @@ def control_panel():
             print(str(e))
             handle_response(str(e))
 
-    return render_template("control_panel.html", projects_list=projects_list)
+    # First page of all projects for the "All" tab, plus fund/refund tabs and info cards totals
+    projects_list, next_cursor = search_projects_page()
+
+    return render_template("control_panel.html",
+                           projects_list=projects_list,
+                           next_cursor=next_cursor,
+                           **search_admin_projects())
 
 
 @app.route("/build_admin_transaction", methods=["POST"])
@@ -522,13 +688,65 @@ def build_admin_transaction():
             for project in data
         ]
 
-        transaction_xdr = build_payment_transaction(admin_operations, operation_type)
-        return jsonify(transaction_xdr=str(transaction_xdr))
+        # Large batches are split into several transactions, to be signed and submitted in order
+        transactions_xdr = build_payment_transaction(admin_operations, operation_type)
+        return jsonify(transactions_xdr=transactions_xdr)
     except Exception as e:
         print(str(e))
         return handle_response({str(e)})
 
 
+""" COMMANDS """
+
+@app.cli.command("rebuild-totals")
+def rebuild_totals_command():
+    """ Recomputes the project_totals table from the transactions ledger. """
+    rebuild_project_totals()
+    print("Project totals rebuilt.")
+
+
+@app.cli.command("verify-totals")
+def verify_totals_command():
+    """ Checks project_totals against the transactions ledger and exits with an error on any mismatch. """
+    mismatches = verify_project_totals()
+
+    for row in mismatches:
+        print(f"Project {row['project_id']}: stored {row['stored_total']} from {row['stored_donors']} donors, "
+              f"expected {row['expected_total']} from {row['expected_donors']} donors")
+
+    if mismatches:
+        raise SystemExit(1)
+    print("Project totals are consistent.")
+
+
+@app.cli.command("backfill-images")
+def backfill_images_command():
+    """ Generates the resized variants of project images uploaded before variants existed. """
+    processed, failed = backfill_image_variants()
+    print(f"{processed} images processed.")
+
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command("gc-images")
+@click.option("--dry-run", is_flag=True, help="Only list the files that would be deleted.")
+def gc_images_command(dry_run):
+    """ Deletes project images (and their variants) no project references anymore. """
+    orphans = collect_image_garbage(dry_run)
+
+    for file_path in orphans:
+        print(file_path)
+    print(f"{len(orphans)} orphaned files {'found' if dry_run else 'deleted'}.")
+
+
+@app.cli.command("ingest-payments")
+def ingest_payments_command():
+    """ Records the admin account's payments missing from the ledger, resuming from the saved Horizon cursor. """
+    recorded = sync_payments(admin_account)
+    print(f"{recorded} missing transactions recorded.")
+
+
 if __name__ == "__main__":
     with app.app_context():
         
@@ -7,21 +7,118 @@ from stellar_sdk import Server
 # Horizon server
 horizon_server = Server("https://horizon-testnet.stellar.org")
 
+# Seconds Horizon account lookups are cached (missing accounts are rechecked sooner)
+ACCOUNT_CACHE_TTL = int(os.environ.get("ACCOUNT_CACHE_TTL", 3600))
+MISSING_ACCOUNT_CACHE_TTL = int(os.environ.get("MISSING_ACCOUNT_CACHE_TTL", 30))
+
+# Fees: seconds between fee_stats refreshes, fallback fee (stroops) and strategy per operation type
+# ("base" is the network base fee, "p10" to "p99" are percentiles of recently charged fees)
+FEE_STATS_TTL = int(os.environ.get("FEE_STATS_TTL", 30))
+DEFAULT_BASE_FEE = 100
+FEE_STRATEGIES = {
+    "donation": os.environ.get("DONATION_FEE_STRATEGY", "p50"),
+    "fund": os.environ.get("FUND_FEE_STRATEGY", "base"),
+    "refund": os.environ.get("REFUND_FEE_STRATEGY", "base"),
+}
+
+# Stellar rejects transactions with more operations than this, larger batches are split
+MAX_OPERATIONS_PER_TRANSACTION = 100
+
+# Seconds the operations of a built transaction wait to be submitted before being discarded
+PENDING_OPERATIONS_TTL = int(os.environ.get("PENDING_OPERATIONS_TTL", 86400))
+
+# Seconds after which a submission that never finished (its worker died) can be submitted again
+SUBMISSION_TIMEOUT = int(os.environ.get("SUBMISSION_TIMEOUT", 120))
+
+# Background threads per worker process submitting signed transactions to Horizon
+SUBMISSION_WORKERS = int(os.environ.get("SUBMISSION_WORKERS", 4))
+
+# Follow the admin account's payments on Horizon in the background, recording the ones whose
+# /send_transaction never arrived (the ingester can also be run with "flask ingest-payments")
+INGEST_PAYMENTS = os.environ.get("INGEST_PAYMENTS", "0") == "1"
+INGEST_RETRY_DELAY = int(os.environ.get("INGEST_RETRY_DELAY", 10))
+
+# Maximum concurrent Horizon requests when checking a batch of destination accounts
+HORIZON_MAX_WORKERS = int(os.environ.get("HORIZON_MAX_WORKERS", 8))
+
 # Project's images directory
 IMAGE_UPLOAD_DIR = "static/images/projects"
 
+# Uploaded images: accepted formats, largest stored side and largest decoded size (pixels),
+# plus the resized variants generated next to each image (name -> width), served as WebP with a PNG fallback
+IMAGE_FORMATS = {"PNG", "JPEG", "WEBP", "GIF"}
+IMAGE_MAX_SIDE = 1600
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_VARIANTS = {"thumb": 400, "detail": 800}
+IMAGE_WEBP_QUALITY = 80
+
+# Images are stored under the SHA-256 of their uploaded content, so their URLs never change content.
+# Files no project references are deleted by "flask gc-images" once older than IMAGE_GC_GRACE_PERIOD seconds
+# (a project may still be being created with them)
+IMAGE_GC_GRACE_PERIOD = int(os.environ.get("IMAGE_GC_GRACE_PERIOD", 86400))
+
+# Largest image file accepted (bytes). Requests may be up to twice as large (other fields, or a base64 image
+# from old clients) and larger ones are refused from their Content-Length, before the body is read
+IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get("IMAGE_MAX_UPLOAD_SIZE", 5 * 1024 * 1024))
+
 # Add categories here
 categories_list = ["books", "education", "environment", "finance", "games", "music", "technology"]
 
 # Projects are updated to this statuses
 status_list = ["active", "fund", "refund", "successful", "unsuccessful"]
 
+# Longest the expiry scheduler sleeps before looking for the next project to expire again (seconds)
+EXPIRY_CHECK_MAX_SLEEP = int(os.environ.get("EXPIRY_CHECK_MAX_SLEEP", 60))
+
+# Number of projects rendered per page (the next pages are loaded on scroll)
+PROJECTS_PAGE_SIZE = 12
+
+# Search bar typeahead: maximum suggestions and seconds before the in-process index is rebuilt
+SUGGEST_LIMIT = 8
+SUGGEST_INDEX_TTL = 300
+
+# Seconds browsers keep static files whose URL changes with their content (fingerprinted or content-addressed)
+STATIC_CACHE_MAX_AGE = 365 * 24 * 3600
+
 # Builds the absolute path to SQLite database
 base_dir = os.path.abspath(os.path.dirname(__file__))
 database_path = os.path.join(base_dir, 'database', 'crowdfunding.db')
 
+# Versioned .sql files applied in order by db.run_migrations()
+MIGRATIONS_DIR = os.path.join(base_dir, 'database', 'migrations')
+
+# Maximum number of SQLite connections kept open by each worker process for requests (background threads open their own)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+
+# Seconds a request waits for a free pooled connection before failing
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# Read-through cache of fetch_query results (process-local, cleared on writes to the tables read)
+QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE_ENABLED", "1") == "1"
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 512))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 30))
+
+# Rendered project cards cache: entries kept by each process and, optionally, a SQLite file shared by all worker processes
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 2048))
+FRAGMENT_CACHE_SHARED = os.environ.get("FRAGMENT_CACHE_SHARED", "0") == "1"
+FRAGMENT_CACHE_SHARED_SIZE = int(os.environ.get("FRAGMENT_CACHE_SHARED_SIZE", 20000))
+fragment_cache_path = os.path.join(base_dir, 'database', 'fragments.db')
+
+# SQLite tuning (WAL is enabled by the migration runner, the rest is set on every connection)
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+
 # Create connection with SQLITE database
 def get_db_connection():
-    conn = sqlite3.connect(database_path)
+    conn = sqlite3.connect(database_path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
-    return conn
\ No newline at end of file
+
+    # Per-connection settings, applied once when the connection is opened
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
@@ -0,0 +1,35 @@
+-- Schema of crowdfunding.db before migrations were introduced.
+-- Existing databases already have these tables, so every statement is IF NOT EXISTS.
+
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    public_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    status TEXT NOT NULL,
+    goal INTEGER NOT NULL,
+    expire_date DATETIME NOT NULL,
+    image_path TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS temp_operations (
+    project_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    destination_account TEXT NOT NULL,
+    type TEXT NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    public_key_sender TEXT NOT NULL,
+    public_key_receiver TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    timestamp DATETIME NOT NULL,
+    hash TEXT NOT NULL,
+    type TEXT NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
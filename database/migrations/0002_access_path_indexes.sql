@@ -0,0 +1,17 @@
+-- Secondary indexes for the hot read paths.
+
+-- calculate_total_donations and search_refund_operations: WHERE type [AND project_id] ... SUM(amount)
+CREATE INDEX IF NOT EXISTS idx_transactions_type_project_amount
+    ON transactions (type, project_id, amount);
+
+-- search_supported_projects and search_donations_history: WHERE public_key_sender AND type GROUP BY project_id
+CREATE INDEX IF NOT EXISTS idx_transactions_sender_type_project
+    ON transactions (public_key_sender, type, project_id, amount);
+
+-- search_projects by status, newest first
+CREATE INDEX IF NOT EXISTS idx_projects_status_created_at
+    ON projects (status, created_at);
+
+-- Projects owned by a user
+CREATE INDEX IF NOT EXISTS idx_projects_public_key
+    ON projects (public_key);
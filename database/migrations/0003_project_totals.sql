@@ -0,0 +1,51 @@
+-- Per-project donation totals, kept up to date by triggers on transactions
+-- so listings read one row per project instead of aggregating every donation.
+
+CREATE TABLE IF NOT EXISTS project_totals (
+    project_id INTEGER PRIMARY KEY,
+    total_donated INTEGER NOT NULL DEFAULT 0,
+    donor_count INTEGER NOT NULL DEFAULT 0,
+    last_donation_at DATETIME,
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
+-- Backfill from the existing ledger
+INSERT OR REPLACE INTO project_totals (project_id, total_donated, donor_count, last_donation_at)
+SELECT project_id, SUM(amount), COUNT(DISTINCT public_key_sender), MAX(timestamp)
+FROM transactions
+WHERE type = 'donation'
+GROUP BY project_id;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_donation_insert
+AFTER INSERT ON transactions
+WHEN NEW.type = 'donation'
+BEGIN
+    INSERT INTO project_totals (project_id, total_donated, donor_count, last_donation_at)
+    VALUES (NEW.project_id, NEW.amount, 1, NEW.timestamp)
+    ON CONFLICT (project_id) DO UPDATE SET
+        total_donated = total_donated + NEW.amount,
+        donor_count = donor_count + NOT EXISTS (
+            SELECT 1 FROM transactions
+            WHERE public_key_sender = NEW.public_key_sender AND type = 'donation'
+            AND project_id = NEW.project_id AND id <> NEW.id
+        ),
+        last_donation_at = MAX(COALESCE(last_donation_at, NEW.timestamp), NEW.timestamp);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_donation_delete
+AFTER DELETE ON transactions
+WHEN OLD.type = 'donation'
+BEGIN
+    UPDATE project_totals SET
+        total_donated = total_donated - OLD.amount,
+        donor_count = donor_count - NOT EXISTS (
+            SELECT 1 FROM transactions
+            WHERE public_key_sender = OLD.public_key_sender AND type = 'donation'
+            AND project_id = OLD.project_id
+        ),
+        last_donation_at = (
+            SELECT MAX(timestamp) FROM transactions
+            WHERE type = 'donation' AND project_id = OLD.project_id
+        )
+    WHERE project_id = OLD.project_id;
+END;
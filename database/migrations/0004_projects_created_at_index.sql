@@ -0,0 +1,5 @@
+-- Unfiltered project listings are paginated newest first by (created_at, id).
+-- The rowid is part of every index entry, so this index serves the id tie-break too.
+
+CREATE INDEX IF NOT EXISTS idx_projects_created_at
+    ON projects (created_at);
@@ -0,0 +1,39 @@
+-- Full-text index over project names and descriptions, used by search_projects for name searches.
+-- External content table: the text lives in projects, triggers keep the index in sync.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+    name,
+    description,
+    content = 'projects',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- Index the existing projects
+INSERT INTO projects_fts (projects_fts) VALUES ('rebuild');
+
+-- Rank matches on the name well above matches on the description
+INSERT INTO projects_fts (projects_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)');
+
+CREATE TRIGGER IF NOT EXISTS trg_projects_fts_insert
+AFTER INSERT ON projects
+BEGIN
+    INSERT INTO projects_fts (rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_projects_fts_delete
+AFTER DELETE ON projects
+BEGIN
+    INSERT INTO projects_fts (projects_fts, rowid, name, description)
+    VALUES ('delete', OLD.id, OLD.name, OLD.description);
+END;
+
+-- Status changes don't touch the indexed columns, so only edits of name/description reindex
+CREATE TRIGGER IF NOT EXISTS trg_projects_fts_update
+AFTER UPDATE OF name, description ON projects
+BEGIN
+    INSERT INTO projects_fts (projects_fts, rowid, name, description)
+    VALUES ('delete', OLD.id, OLD.name, OLD.description);
+    INSERT INTO projects_fts (rowid, name, description) VALUES (NEW.id, NEW.name, NEW.description);
+END;
@@ -0,0 +1,3 @@
+-- Batches larger than MAX_OPERATIONS_PER_TRANSACTION are split into several transactions:
+-- each pending operation remembers which transaction of the batch (0, 1, 2...) carries it
+ALTER TABLE temp_operations ADD COLUMN transaction_index INTEGER NOT NULL DEFAULT 0;
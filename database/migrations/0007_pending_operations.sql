@@ -0,0 +1,24 @@
+-- Operations waiting for their transaction to be submitted, keyed by the transaction hash
+-- (the hash doesn't change when the envelope is signed), so concurrent donations and admin batches
+-- each resolve their own rows instead of sharing the single temp_operations table.
+
+CREATE TABLE IF NOT EXISTS pending_operations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_hash TEXT NOT NULL,
+    project_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    source_account TEXT NOT NULL,
+    destination_account TEXT NOT NULL,
+    type TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pending_operations_transaction_hash
+    ON pending_operations (transaction_hash);
+
+-- Abandoned transactions (never signed or submitted) are cleaned up by age
+CREATE INDEX IF NOT EXISTS idx_pending_operations_created_at
+    ON pending_operations (created_at);
+
+DROP TABLE IF EXISTS temp_operations;
@@ -0,0 +1,27 @@
+-- Each operation of a Stellar transaction is recorded once: op_index is the position of the row within its
+-- transaction, and (hash, op_index) is unique, so a retried submission can never double-count a donation.
+
+ALTER TABLE transactions ADD COLUMN op_index INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill in insertion order
+UPDATE transactions SET op_index = (
+    SELECT numbered.op_index FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY hash ORDER BY id) - 1 AS op_index
+        FROM transactions
+    ) numbered
+    WHERE numbered.id = transactions.id
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_hash_op_index
+    ON transactions (hash, op_index);
+
+-- Submission registry, keyed by the envelope hash: a repeated submission (double click, browser retry)
+-- is answered from here instead of being sent to Horizon again.
+-- status is 'submitting' while a request is waiting for Horizon, then 'successful' or 'failed'
+CREATE TABLE IF NOT EXISTS submissions (
+    transaction_hash TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+);
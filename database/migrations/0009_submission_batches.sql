@@ -0,0 +1,14 @@
+-- Signed transactions received by /send_transaction are submitted in the background:
+-- each request becomes a batch (one or more transactions, submitted in order) whose progress is polled by its id.
+-- status is 'queued', 'submitting', 'successful' or 'failed'; hashes is the JSON list of the batch's transactions.
+
+CREATE TABLE IF NOT EXISTS submission_batches (
+    id TEXT PRIMARY KEY,
+    public_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    hashes TEXT NOT NULL,
+    submitted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+);
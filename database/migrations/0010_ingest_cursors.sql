@@ -0,0 +1,8 @@
+-- Position reached by each Horizon stream the app follows (the paging_token of the last record processed),
+-- so ingestion resumes where it stopped after a restart.
+
+CREATE TABLE IF NOT EXISTS ingest_cursors (
+    name TEXT PRIMARY KEY,
+    cursor TEXT NOT NULL,
+    updated_at DATETIME NOT NULL
+);
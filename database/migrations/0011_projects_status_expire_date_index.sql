@@ -0,0 +1,5 @@
+-- The expiry scheduler reads the next active project to expire (MIN(expire_date) WHERE status = 'active')
+-- and transitions the due ones (WHERE status = 'active' AND expire_date < now), both served by this index.
+
+CREATE INDEX IF NOT EXISTS idx_projects_status_expire_date
+    ON projects (status, expire_date);
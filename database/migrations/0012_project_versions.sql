@@ -0,0 +1,45 @@
+-- Per-project change counter, bumped by triggers whenever a project or its transactions change.
+-- Pages showing projects derive their ETag from it, so unchanged pages are answered with 304 Not Modified.
+
+CREATE TABLE IF NOT EXISTS project_versions (
+    project_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at DATETIME NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id)
+);
+
+INSERT OR IGNORE INTO project_versions (project_id, version, updated_at)
+SELECT id, 1, CURRENT_TIMESTAMP FROM projects;
+
+CREATE TRIGGER IF NOT EXISTS trg_project_versions_project_insert
+AFTER INSERT ON projects
+BEGIN
+    INSERT INTO project_versions (project_id, version, updated_at)
+    VALUES (NEW.id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (project_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_project_versions_project_update
+AFTER UPDATE ON projects
+BEGIN
+    INSERT INTO project_versions (project_id, version, updated_at)
+    VALUES (NEW.id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (project_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+-- Donations change totals and progress, funds and refunds are listed on the project page
+CREATE TRIGGER IF NOT EXISTS trg_project_versions_transaction_insert
+AFTER INSERT ON transactions
+BEGIN
+    INSERT INTO project_versions (project_id, version, updated_at)
+    VALUES (NEW.project_id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (project_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_project_versions_transaction_delete
+AFTER DELETE ON transactions
+BEGIN
+    INSERT INTO project_versions (project_id, version, updated_at)
+    VALUES (OLD.project_id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (project_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+END;
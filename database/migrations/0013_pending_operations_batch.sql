@@ -0,0 +1,7 @@
+-- Transactions built together (a fund/refund batch split in chunks) share a batch_id, so a project's status
+-- only changes once every transaction of its batch carrying operations for it has been recorded.
+
+ALTER TABLE pending_operations ADD COLUMN batch_id TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_pending_operations_batch_id_project_id
+    ON pending_operations (batch_id, project_id);
@@ -0,0 +1,7 @@
+-- Keep the signed transactions of each submission batch, so batches left unfinished by a worker process
+-- that stopped (or was recycled) are submitted again when the submission workers start.
+
+ALTER TABLE submission_batches ADD COLUMN transactions TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_submission_batches_status_updated_at
+    ON submission_batches (status, updated_at);
@@ -0,0 +1,8 @@
+-- Last sequence number known to be on the ledger for the admin account, shared by every worker process:
+-- the process building a transaction is often not the one whose submission worker moved the sequence forward.
+
+CREATE TABLE IF NOT EXISTS account_sequences (
+    account_id TEXT PRIMARY KEY,
+    sequence INTEGER NOT NULL,
+    updated_at DATETIME NOT NULL
+);
@@ -0,0 +1,529 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from config import (DB_POOL_SIZE, DB_POOL_TIMEOUT, FRAGMENT_CACHE_SHARED, FRAGMENT_CACHE_SHARED_SIZE, FRAGMENT_CACHE_SIZE,
+                    MIGRATIONS_DIR, QUERY_CACHE_ENABLED, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, fragment_cache_path,
+                    get_db_connection)
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, has_app_context
+from functools import wraps
+
+
+""" CONNECTION POOL """
+
+# Idle connections ready to be reused (last in, first out keeps the hottest ones busy)
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# Bounds how many connections can be checked out at the same time
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+# Process that owns the pool (forked workers must not share sqlite connections)
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+
+# Connection owned by the current background thread (see own_connection), None for request threads
+_thread_connection = threading.local()
+
+
+def _reset_pool_after_fork():
+    """
+    Discards the pool inherited from a parent process, so each worker process opens its own connections.
+    """
+    global _pool, _pool_slots, _pool_pid
+
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+            _pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+            _pool_pid = os.getpid()
+
+
+def acquire_connection():
+    """
+    Checks out a connection from the pool, opening a new one if there isn't any idle connection.
+
+    Returns:
+        sqlite3.Connection: a connection with pragmas already applied.
+    """
+    _reset_pool_after_fork()
+
+    # Wait for a free slot so the pool never grows beyond DB_POOL_SIZE
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise Exception("Timed out waiting for a database connection.")
+
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        pass
+
+    try:
+        return get_db_connection()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def release_connection(conn):
+    """
+    Returns a connection to the pool, rolling back anything left uncommitted.
+
+    Params:
+        conn (sqlite3.Connection): connection previously returned by acquire_connection.
+    """
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put_nowait(conn)
+    except Exception:
+        # Broken connections (or a full pool after a fork) are simply closed
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+
+def get_db():
+    """
+    Returns the connection bound to the current request, checking one out of the pool on first use.
+
+    Returns:
+        sqlite3.Connection: the request-scoped connection.
+    """
+    if "db" not in g:
+        g.db = acquire_connection()
+    return g.db
+
+
+def close_db(exception=None):
+    """
+    Gives the request-scoped connection back to the pool. Registered as an app teardown function.
+
+    Params:
+        exception (Exception, optional): the exception that ended the request, if any.
+    """
+    conn = g.pop("db", None)
+    if conn is not None:
+        release_connection(conn)
+
+
+def own_connection(f):
+    """
+    Decorator for background thread loops (submission workers, schedulers): the thread opens its own connection
+    and db_connection uses it instead of the pool. Requests keep their pooled connection across Horizon round trips,
+    so under load a background thread sharing the pool would time out waiting for one.
+
+    Params:
+        f (function): the thread's target function.
+
+    Returns:
+        function: the target running with its own connection, closed when it returns.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        _thread_connection.conn = get_db_connection()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            conn = _thread_connection.conn
+            _thread_connection.conn = None
+            conn.close()
+    return decorated_function
+
+
+@contextmanager
+def db_connection():
+    """
+    Yields a database connection: the background thread's own one (see own_connection), the request-scoped one
+    inside Flask, or a pooled connection held only for the block when running outside an app context.
+    """
+    conn = getattr(_thread_connection, "conn", None)
+    if conn is not None:
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+        return
+
+    if has_app_context():
+        yield get_db()
+        return
+
+    conn = acquire_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+""" QUERY CACHE """
+
+# Cached SELECT results in LRU order: (query, params) -> (expires_at, tables read, rows)
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+_query_cache_counters = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+# Incremented on every invalidation, so a result read before a write can't be cached after it
+_query_cache_generation = 0
+
+# Tables written by triggers when another table is written (see database/migrations)
+TRIGGER_WRITES = {
+    "transactions": {"project_totals", "project_versions"},
+    "projects": {"projects_fts", "project_versions"},
+}
+
+
+def read_tables(query):
+    """
+    Finds the tables a SELECT query reads from (every FROM and JOIN, subqueries included).
+
+    Params:
+        query (str): SQL query string.
+
+    Returns:
+        set: lowercase table names.
+    """
+    return {table.lower() for table in re.findall(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", query, re.IGNORECASE)}
+
+
+def written_tables(query):
+    """
+    Finds the tables changed by an INSERT, UPDATE or DELETE query, including the ones changed by triggers.
+
+    Params:
+        query (str): SQL query string.
+
+    Returns:
+        set: lowercase table names.
+    """
+    match = re.match(
+        r"\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+([A-Za-z_]\w*)",
+        query, re.IGNORECASE)
+    if not match:
+        return set()
+
+    table = match.group(1).lower()
+    return {table} | TRIGGER_WRITES.get(table, set())
+
+
+def query_cache_get(query, params):
+    """
+    Looks up the cached result of a SELECT query.
+
+    Params:
+        query (str): SQL query string.
+        params (tuple): parameters of the query.
+
+    Returns:
+        list: a copy of the cached rows, or None if the result isn't cached (or expired).
+    """
+    if not QUERY_CACHE_ENABLED:
+        return None
+
+    key = (query, params)
+
+    with _query_cache_lock:
+        entry = _query_cache.get(key)
+
+        if entry is None or entry[0] < time.monotonic():
+            _query_cache.pop(key, None)
+            _query_cache_counters["misses"] += 1
+            return None
+
+        # Mark as most recently used
+        _query_cache.move_to_end(key)
+        _query_cache_counters["hits"] += 1
+
+    # Callers change the rows they get (formatting, progress), so each one gets its own copy
+    return [dict(row) for row in entry[2]]
+
+
+def query_cache_generation():
+    """
+    Returns the current invalidation generation, to be read before executing a query that will be cached.
+
+    Returns:
+        int: number of invalidations so far.
+    """
+    return _query_cache_generation
+
+
+def query_cache_set(query, params, rows, generation):
+    """
+    Stores the result of a SELECT query, evicting the least recently used entries above QUERY_CACHE_SIZE.
+
+    Params:
+        query (str): SQL query string.
+        params (tuple): parameters of the query.
+        rows (list): fetched rows as dictionaries.
+        generation (int): query_cache_generation() read before the query was executed.
+    """
+    if not QUERY_CACHE_ENABLED:
+        return
+
+    entry = (time.monotonic() + QUERY_CACHE_TTL, read_tables(query), [dict(row) for row in rows])
+
+    with _query_cache_lock:
+
+        # A write happened while the query ran, the rows may already be stale
+        if generation != _query_cache_generation:
+            return
+
+        _query_cache[(query, params)] = entry
+        _query_cache.move_to_end((query, params))
+
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+            _query_cache_counters["evictions"] += 1
+
+
+def invalidate_query_cache(tables):
+    """
+    Drops every cached result that read from any of the given tables.
+
+    Params:
+        tables (set): lowercase names of the tables that were written.
+    """
+    global _query_cache_generation
+
+    if not tables:
+        return
+
+    with _query_cache_lock:
+        _query_cache_generation += 1
+        stale_keys = [key for key, entry in _query_cache.items() if entry[1] & tables]
+        for key in stale_keys:
+            del _query_cache[key]
+        _query_cache_counters["invalidations"] += len(stale_keys)
+
+
+def query_cache_stats():
+    """
+    Returns the query cache counters.
+
+    Returns:
+        dict: enabled flag, current size and the hits, misses, invalidations and evictions counters.
+    """
+    with _query_cache_lock:
+        return {"enabled": QUERY_CACHE_ENABLED, "size": len(_query_cache), **_query_cache_counters}
+
+
+""" FRAGMENT CACHE """
+
+# Rendered HTML fragments in LRU order: key -> html. Keys contain everything the HTML depends on
+# (such as the project's version), so entries are never invalidated, only evicted
+_fragment_cache = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+_fragment_cache_counters = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0}
+
+# Connection to the shared SQLite file (FRAGMENT_CACHE_SHARED), opened once per process
+_fragment_db = None
+_fragment_db_pid = None
+
+
+def _fragment_db_connection():
+    """
+    Returns this process's connection to the shared fragment cache file, creating the file on first use.
+    Must be called holding _fragment_cache_lock.
+
+    Returns:
+        sqlite3.Connection: the connection.
+    """
+    global _fragment_db, _fragment_db_pid
+
+    if _fragment_db_pid != os.getpid():
+        _fragment_db = sqlite3.connect(fragment_cache_path, check_same_thread=False, isolation_level=None)
+
+        # Losing cached fragments on a crash is harmless, so writes never wait for the disk
+        _fragment_db.execute("PRAGMA journal_mode = WAL")
+        _fragment_db.execute("PRAGMA synchronous = OFF")
+        _fragment_db.execute(f"PRAGMA busy_timeout = {int(DB_POOL_TIMEOUT * 1000)}")
+        _fragment_db.execute("CREATE TABLE IF NOT EXISTS fragments (key TEXT PRIMARY KEY, html TEXT NOT NULL)")
+        _fragment_db_pid = os.getpid()
+
+    return _fragment_db
+
+
+def _fragment_cache_remember(key, html):
+    """
+    Stores a fragment in the process cache, evicting the least recently used ones above FRAGMENT_CACHE_SIZE.
+    Must be called holding _fragment_cache_lock.
+    """
+    _fragment_cache[key] = html
+    _fragment_cache.move_to_end(key)
+
+    while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+        _fragment_cache.popitem(last=False)
+        _fragment_cache_counters["evictions"] += 1
+
+
+def fragment_cache_get_many(keys):
+    """
+    Looks up rendered fragments: first in this process's cache, then (for the rest, in one query)
+    in the shared SQLite file when FRAGMENT_CACHE_SHARED is enabled.
+
+    Params:
+        keys (list): fragment keys.
+
+    Returns:
+        dict: key -> html for the fragments found.
+    """
+    found = {}
+
+    with _fragment_cache_lock:
+        for key in keys:
+            html = _fragment_cache.get(key)
+            if html is not None:
+                _fragment_cache.move_to_end(key)
+                found[key] = html
+        _fragment_cache_counters["hits"] += len(found)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+
+        if missing and FRAGMENT_CACHE_SHARED:
+            conn = _fragment_db_connection()
+
+            # Stay below SQLite's limit of parameters per statement
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, html FROM fragments WHERE key IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+                for key, html in rows:
+                    found[key] = html
+                    _fragment_cache_remember(key, html)
+                _fragment_cache_counters["shared_hits"] += len(rows)
+
+        _fragment_cache_counters["misses"] += sum(key not in found for key in missing)
+
+    return found
+
+
+def fragment_cache_set_many(fragments):
+    """
+    Stores rendered fragments in this process's cache and, when FRAGMENT_CACHE_SHARED is enabled, in the shared file
+    (which keeps the FRAGMENT_CACHE_SHARED_SIZE most recently stored ones).
+
+    Params:
+        fragments (dict): key -> html.
+    """
+    if not fragments:
+        return
+
+    with _fragment_cache_lock:
+        for key, html in fragments.items():
+            _fragment_cache_remember(key, html)
+
+        if not FRAGMENT_CACHE_SHARED:
+            return
+
+        conn = _fragment_db_connection()
+        try:
+            # Replaced rows get a new rowid, so rowids follow the order fragments were stored in
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR REPLACE INTO fragments (key, html) VALUES (?, ?)", list(fragments.items()))
+            conn.execute("""
+                DELETE FROM fragments WHERE rowid <= (
+                    SELECT rowid FROM fragments ORDER BY rowid DESC LIMIT 1 OFFSET ?)
+            """, (FRAGMENT_CACHE_SHARED_SIZE,))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # The shared file is only a cache: rendering goes on without it
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error writing fragment cache: {str(e)}")
+
+
+def fragment_cache_stats():
+    """
+    Returns the fragment cache counters.
+
+    Returns:
+        dict: shared flag, current size and the hits, shared_hits, misses and evictions counters.
+    """
+    with _fragment_cache_lock:
+        return {"shared": FRAGMENT_CACHE_SHARED, "size": len(_fragment_cache), **_fragment_cache_counters}
+
+
+""" MIGRATIONS """
+
+def list_migrations():
+    """
+    Lists the migration files found in MIGRATIONS_DIR, named like '0001_description.sql'.
+
+    Returns:
+        list: (version, name, path) tuples sorted by version.
+    """
+    migrations = []
+
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+
+    return sorted(migrations)
+
+
+def run_migrations():
+    """
+    Brings the database up to date: enables WAL mode and applies every pending migration in version order.
+    Each migration runs in its own transaction together with its row in schema_migrations,
+    so it is either fully applied and recorded or not applied at all.
+
+    Returns:
+        list: names of the migrations applied by this call.
+    """
+    applied_now = []
+    conn = get_db_connection()
+
+    try:
+        # WAL lets readers continue while a donation is being written (it can't be changed inside a transaction)
+        conn.execute("PRAGMA journal_mode = WAL")
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at DATETIME NOT NULL
+            )
+        """)
+        conn.commit()
+
+        applied = {row["version"] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+        for version, name, path in list_migrations():
+            if version in applied:
+                continue
+
+            with open(path) as f:
+                migration_sql = f.read()
+
+            # Claim the version first: if another worker process applied it meanwhile, the insert fails
+            script = f"""
+                BEGIN IMMEDIATE;
+                INSERT INTO schema_migrations (version, name, applied_at)
+                VALUES ({version}, '{name}', '{datetime.now()}');
+                {migration_sql}
+                COMMIT;
+            """
+
+            try:
+                conn.executescript(script)
+                applied_now.append(name)
+            except Exception as e:
+                conn.rollback()
+
+                # Only a version claimed meanwhile by another worker process is skipped,
+                # a migration failing on its own (even with a constraint violation) stops the startup
+                claimed = conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone()
+                if isinstance(e, sqlite3.IntegrityError) and claimed:
+                    continue
+                raise Exception(f"Error applying migration {version}_{name}: {str(e)}")
+
+        return applied_now
+    finally:
+        conn.close()
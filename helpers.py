@@ -1,54 +1,87 @@
 import base64
+import bisect
+import hashlib
+import io
+import json
 import math
 import os
+import queue
+import re
 import secrets
+import threading
+import time
 import traceback
 
-from datetime import datetime
-from config import IMAGE_UPLOAD_DIR, get_db_connection, categories_list, horizon_server
-from flask import redirect, render_template, request, session
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from config import (EXPIRY_CHECK_MAX_SLEEP, IMAGE_FORMATS, IMAGE_GC_GRACE_PERIOD, IMAGE_MAX_PIXELS, IMAGE_MAX_SIDE,
+                    IMAGE_MAX_UPLOAD_SIZE, IMAGE_UPLOAD_DIR, IMAGE_VARIANTS, IMAGE_WEBP_QUALITY, INGEST_RETRY_DELAY,
+                    MAX_OPERATIONS_PER_TRANSACTION, PENDING_OPERATIONS_TTL, PROJECTS_PAGE_SIZE, QUERY_CACHE_ENABLED,
+                    QUERY_CACHE_TTL, STATIC_CACHE_MAX_AGE, SUBMISSION_TIMEOUT, SUBMISSION_WORKERS, SUGGEST_INDEX_TTL, SUGGEST_LIMIT,
+                    base_dir, categories_list, horizon_server)
+from db import (db_connection, fragment_cache_get_many, fragment_cache_set_many, invalidate_query_cache, own_connection,
+                query_cache_generation, query_cache_get, query_cache_set, written_tables)
+from flask import current_app, make_response, redirect, render_template, request, session
+from horizon import (fetch_payments, find_missing_accounts, get_fee, load_source_account, record_submission_result,
+                     stream_payments, transaction_hash)
 from functools import wraps
+from markupsafe import Markup
+from PIL import Image, ImageOps, UnidentifiedImageError
 from stellar_sdk import Asset, Network, TransactionBuilder
-from stellar_sdk.exceptions import NotFoundError
+from stellar_sdk.exceptions import BadRequestError
 
 admin_account = os.environ.get('ADMIN_ACCOUNT')
 
 
 """ QUERIES """
 
-def fetch_query(query, params=()):
+def fetch_query(query, params=(), cache=True):
     """
     Executes a SELECT SQL query with optional parameters and returns the fetched results.
+    Results are served from the query cache until a write_query touches one of the tables they read.
     
     Params:
         query (str): SQL query string for data retrieval.
         params (tuple, optional): parameters tuple for the SQL query.
+        cache (bool, optional): False to always read from the database
+        (for rows another worker process may have just written).
     
     Returns:
         list: list of dictionaries representing fetched rows,
         or an empty list in case of an exception.
     """
-    try:
-        # Establish a new db connection and create a new cursor
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    cursor = None
 
-        # Ensure the params are a tuple
-        if not isinstance(params, tuple):
-            params = (params,)
+    # Ensure the params are a tuple
+    if not isinstance(params, tuple):
+        params = (params,)
 
-        # Execute query and return a list of dictionaries
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+    try:
+        # Return the cached result if the tables it reads haven't changed
+        if cache:
+            rows = query_cache_get(query, params)
+            if rows is not None:
+                return rows
+        generation = query_cache_generation()
+
+        # Reuse the request's pooled connection and create a new cursor
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Execute query and return a list of dictionaries
+            cursor.execute(query, params)
+            rows = [dict(row) for row in cursor.fetchall()]
+
+        if cache:
+            query_cache_set(query, params, rows, generation)
+        return rows
     except Exception as e:
         print(f"Error in fetch query execution: {e}")
         return []
     finally:
-        # Close cursor and db connection
+        # Close cursor (the connection goes back to the pool at the end of the request)
         if cursor:
             cursor.close()
-        if conn:
-            conn.close()
 
 
 def write_query(query, params=()):
@@ -61,30 +94,80 @@ def write_query(query, params=()):
         defaults to tuple ().
     
     Return:
-        Success: this function doesn't return anything.
+        Success: the number of rows changed.
         Failure: raises a detailed error.
     """
-    try:
-        # Establish a new db connection and create a new cursor
-        conn = get_db_connection()
+    with db_connection() as conn:
         cursor = conn.cursor()
 
-        # Ensure the params are a tuple
-        if not isinstance(params, tuple):
-            params = (params,)
+        try:
+            # Ensure the params are a tuple
+            if not isinstance(params, tuple):
+                params = (params,)
 
-        # Execute and commit changes to database
-        cursor.execute(query, params)
-        conn.commit()
-    except Exception as e:
+            # Execute and commit changes to database
+            cursor.execute(query, params)
+            conn.commit()
 
-        # Roll back any changes made during the transaction in case of an error
-        conn.rollback()
-        raise Exception(f"Error writing query into database: {str(e)}.")
-    finally:
-        # Close cursor and db connection
-        cursor.close()
-        conn.close()
+            # Forget cached results that read the changed tables
+            invalidate_query_cache(written_tables(query))
+            return cursor.rowcount
+        except Exception as e:
+
+            # Roll back any changes made during the transaction in case of an error
+            conn.rollback()
+            raise Exception(f"Error writing query into database: {str(e)}.")
+        finally:
+            # Close cursor (the connection goes back to the pool at the end of the request)
+            cursor.close()
+
+
+def write_many_query(query, params_list):
+    """
+    Executes an SQL query for database modification once per parameters tuple, all in a single transaction.
+    
+    Params:
+        query (str): SQL query string for data modification.
+        params_list (list): list of parameters tuples for the SQL query.
+    
+    Return:
+        Success: this function doesn't return anything.
+        Failure: raises a detailed error (and nothing is written).
+    """
+    write_batch_query([(query, params_list)])
+
+
+def write_batch_query(statements):
+    """
+    Executes several SQL queries for database modification atomically:
+    every statement is committed together, or nothing is written at all.
+    
+    Params:
+        statements (list): list of (query, params_list) tuples, each query executed once per parameters tuple.
+    
+    Return:
+        Success: this function doesn't return anything.
+        Failure: raises a detailed error (and nothing is written).
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Execute every statement and commit changes to database at once
+            for query, params_list in statements:
+                cursor.executemany(query, params_list)
+            conn.commit()
+
+            # Forget cached results that read the changed tables
+            invalidate_query_cache(set().union(*[written_tables(query) for query, _ in statements]))
+        except Exception as e:
+
+            # Roll back any changes made during the transaction in case of an error
+            conn.rollback()
+            raise Exception(f"Error writing query into database: {str(e)}.")
+        finally:
+            # Close cursor (the connection goes back to the pool at the end of the request)
+            cursor.close()
 
 
 """ FORMATTING  """
@@ -120,10 +203,48 @@ def format_date(date_str, to_type):
 
 """ PAYMENTS """
 
+def plan_payments(operations_list, operation_type):
+    """
+    Groups operations into the payments to append to the transaction.
+    Refunds going to the same donor (who may have backed several failed projects) are merged into a single payment,
+    while each payment keeps its per-project operations for the ledger (see insert_transaction_into_database).
+
+    Params:
+        operations_list (list): list of dictionaries with 'project_id', 'amount' and 'destination_account'.
+        operation_type (str): 'donation', 'fund', or 'refund'.
+
+    Returns:
+        list: list of dictionaries with 'destination_account', 'amount' (str, as expected by Stellar)
+        and 'operations' (the operations paid by it), in the order destinations first appear.
+    """
+    payments = {}
+
+    for index, operation in enumerate(operations_list):
+
+        # Only refunds are merged, everything else is paid one operation at a time
+        key = operation["destination_account"] if operation_type == "refund" else index
+        payment = payments.setdefault(key, {
+            "destination_account": operation["destination_account"],
+            "amount": Decimal(0),
+            "operations": []
+        })
+
+        # Sum as decimals, so merged amounts keep Stellar's 7 digits precision
+        payment["amount"] += Decimal(str(operation["amount"]))
+        payment["operations"].append(operation)
+
+    for payment in payments.values():
+        payment["amount"] = f'{payment["amount"].quantize(Decimal("0.0000001")).normalize():f}'
+
+    return list(payments.values())
+
+
 def build_payment_transaction(operations_list, operation_type):
     """
-    Builds one operation per project, grouping into one transaction.
+    Builds one payment operation per project (per donor for refunds, see plan_payments), grouping them into transactions.
     Each transaction has it's own operation type (donation for users and fund/refund for admin)
+    Stellar accepts at most MAX_OPERATIONS_PER_TRANSACTION operations per transaction,
+    so larger batches are split into several transactions with consecutive sequence numbers.
     
     Params:
         - operations_list: list of dictionaries, each containing:
@@ -132,71 +253,547 @@ def build_payment_transaction(operations_list, operation_type):
             'donation', 'fund', or 'refund'
 
     Returns:
-        A string with the transaction in XDR format for the user to sign.
+        A list of transactions in XDR format for the user to sign (and submit) in order.
     """
 
-    # Check if destination account exists
-    for operation in operations_list:
-        try:
-            horizon_server.load_account(operation["destination_account"])
-        except NotFoundError:
-            raise NotFoundError("This destination account doesn't exists.")
+    # Check if destination accounts exist, all at once (known accounts are cached, see horizon.py)
+    missing_accounts = find_missing_accounts([operation["destination_account"] for operation in operations_list])
+    if missing_accounts:
+        raise Exception("Invalid destination accounts: " + " ".join(missing_accounts))
 
     try:
         # Set the source acccount (for donations is the user account, for funds and refunds is the admin account)
         public_key_sender = admin_account if operation_type in ["fund", "refund"] else operations_list[0]["source_account"]
         
-        # Get transaction fee from Stellar Network
-        base_fee = horizon_server.fetch_base_fee()
-
-        # Load the source account (admin) to proper type
-        source_account = horizon_server.load_account(public_key_sender)
-        
-        # Build transaction
-        transaction = (
-            TransactionBuilder(
-                source_account=source_account,
-                network_passphrase=Network.TESTNET_NETWORK_PASSPHRASE,
-                base_fee=base_fee,
+        # Get transaction fee from the cached Stellar Network fee stats (never blocks on Horizon)
+        base_fee = get_fee(operation_type)
+
+        # Load the source account to proper type (admin's sequence number is tracked locally)
+        source_account = load_source_account(public_key_sender)
+
+        # Merge refunds per donor, then split the payments into chunks that fit in one transaction
+        payments = plan_payments(operations_list, operation_type)
+        chunks = [
+            payments[i:i + MAX_OPERATIONS_PER_TRANSACTION]
+            for i in range(0, len(payments), MAX_OPERATIONS_PER_TRANSACTION)
+        ]
+
+        # Every transaction of the batch shares an ID, so projects spanning several of them are settled with the last one
+        batch_id = secrets.token_hex(8)
+
+        transactions_xdr = []
+        pending_operations = []
+        for chunk in chunks:
+
+            # Build transaction (building increments the source account's sequence number,
+            # so each transaction of the batch gets the one following the previous transaction)
+            transaction = (
+                TransactionBuilder(
+                    source_account=source_account,
+                    network_passphrase=Network.TESTNET_NETWORK_PASSPHRASE,
+                    base_fee=base_fee,
+                )
             )
-        )
 
-        # Fetch temporary transactions data from database
-        temp_transactions_list = fetch_query("SELECT * FROM temp_operations")
+            # Append payment operations for each project (or donor)
+            for payment in chunk:
+                transaction.append_payment_op(
+                    destination=payment["destination_account"],
+                    asset=Asset.native(),
+                    amount=payment["amount"]
+                )
+
+            # Set max timelimit (in seconds) to process transaction, leaving time to sign every transaction of the batch
+            transaction.set_timeout(30 * len(chunks))
+            transaction = transaction.build()
+
+            # Keep operations per project under the transaction hash (signing doesn't change it),
+            # to update database after submitting the transaction
+            transaction_hash = transaction.hash_hex()
+            for payment in chunk:
+                for operation in payment["operations"]:
+                    pending_operations.append((
+                        transaction_hash, operation["project_id"], operation["amount"],
+                        public_key_sender, operation["destination_account"], operation_type, batch_id, datetime.now()
+                    ))
+
+            # Convert transaction to XDR format for signing
+            transactions_xdr.append(transaction.to_xdr())
+
+        # Forget abandoned transactions, then save the new pending operations all at once
+        write_query("DELETE FROM pending_operations WHERE created_at < ?",
+                    datetime.now() - timedelta(seconds=PENDING_OPERATIONS_TTL))
+        query = """
+            INSERT INTO pending_operations
+            (transaction_hash, project_id, amount, source_account, destination_account, type, batch_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        write_many_query(query, pending_operations)
+
+        return transactions_xdr
+    except Exception as e:
+        raise Exception(f"Error building payment transaction: {str(e)}")
 
-        # Clear table if it's not empty
-        if temp_transactions_list:
-            write_query("DELETE FROM temp_operations")
 
-        # Append payment operations for each project
-        for operation in operations_list:
-            transaction.append_payment_op(
-                destination=operation["destination_account"],
-                asset=Asset.native(),
-                amount=str(operation["amount"])
-            )
+""" SUBMISSIONS """
 
-            # Temporarily save operations to update database after submitting the transaction
-            query = """
-                INSERT INTO temp_operations
-                (project_id, amount, destination_account, type)
-                VALUES(?, ?, ?, ?)
-            """
-            params = (
-                operation["project_id"],
-                operation["amount"], operation["destination_account"], operation_type
-            )
-            write_query(query, params)
+# IDs of the batches of signed transactions waiting for a submission worker (their transactions are stored in the database)
+submission_queue = queue.Queue()
+submission_workers_pid = None
+submission_workers_lock = threading.Lock()
+
+
+def get_submission(hash):
+    """
+    Looks up a transaction in the submission registry.
+
+    Params:
+        hash (str): the transaction hash.
+
+    Returns:
+        dict: the submission ('status' is 'submitting', 'successful' or 'failed', 'result' is a dictionary),
+        or None if the transaction was never submitted.
+    """
+    submissions = fetch_query("SELECT * FROM submissions WHERE transaction_hash = ?", hash, cache=False)
+    if not submissions:
+        return None
+
+    submission = submissions[0]
+    submission["result"] = json.loads(submission["result"]) if submission["result"] else {}
+    return submission
+
+
+def claim_submission(hash):
+    """
+    Registers a transaction as being submitted, unless another request is already submitting it or already did.
+    Failed transactions can be claimed again, as well as transactions whose submitter never finished
+    (for longer than SUBMISSION_TIMEOUT seconds).
+
+    Params:
+        hash (str): the transaction hash.
+
+    Returns:
+        bool: True if the caller must submit the transaction, False otherwise.
+    """
+    now = datetime.now()
+    query = """
+        INSERT INTO submissions (transaction_hash, status, created_at, updated_at)
+        VALUES (?, 'submitting', ?, ?)
+        ON CONFLICT (transaction_hash) DO UPDATE SET status = 'submitting', result = NULL, updated_at = excluded.updated_at
+        WHERE status = 'failed' OR (status = 'submitting' AND updated_at < ?)
+    """
+    params = (hash, now, now, now - timedelta(seconds=SUBMISSION_TIMEOUT))
+    return write_query(query, params) == 1
+
+
+def finish_submission(hash, status, result):
+    """
+    Stores the outcome of a submitted transaction in the registry.
+
+    Params:
+        hash (str): the transaction hash.
+        status (str): 'successful' or 'failed'.
+        result (dict): details returned to repeated submissions (ledger, or error message).
+    """
+    query = "UPDATE submissions SET status = ?, result = ?, updated_at = ? WHERE transaction_hash = ?"
+    write_query(query, (status, json.dumps(result), datetime.now(), hash))
+
+
+def submit_payment_transaction(signed_transaction):
+    """
+    Submits a signed transaction built by build_payment_transaction to Stellar and records its operations.
+    A transaction already on the ledger is answered from the submission registry without asking Horizon again,
+    and one still being submitted by another request (a double click) waits for that submission's outcome.
+
+    Params:
+        signed_transaction (str): the signed transaction in XDR format.
+
+    Returns:
+        Success: a string with the transaction hash.
+        Failure: raises a detailed error.
+    """
+    hash = transaction_hash(signed_transaction)
 
-        # Set max timelimit (in seconds) to process transaction
-        transaction.set_timeout(30)
-        transaction = transaction.build()
+    # Repeated submission of a transaction already recorded
+    submission = get_submission(hash)
+    if submission and submission["status"] == "successful":
+        return hash
 
-        # Convert transaction to XDR format and return for signing
-        transaction_xdr = transaction.to_xdr()
-        return transaction_xdr
+    # Only submit transactions built by this app, each one resolving its own pending operations
+    if not fetch_query("SELECT 1 FROM pending_operations WHERE transaction_hash = ? LIMIT 1", hash, cache=False):
+        raise Exception("Transaction is unknown or expired.")
+
+    # Another request (a double click) is already submitting it: its outcome is this one's
+    if not claim_submission(hash):
+        return wait_for_submission(hash)
+
+    try:
+        submit_response = horizon_server.submit_transaction(signed_transaction)
+    except BadRequestError as e:
+
+        # Resync the source account's sequence number if Horizon rejected it
+        record_submission_result(signed_transaction, False, (e.extras or {}).get("result_codes"))
+        finish_submission(hash, "failed", {"error": str(e)})
+        raise
     except Exception as e:
-        raise Exception(f"Error building payment transaction: {str(e)}")
+        finish_submission(hash, "failed", {"error": str(e)})
+        raise
+
+    record_submission_result(signed_transaction, submit_response["successful"])
+
+    if submit_response["successful"] != True:
+        finish_submission(hash, "failed", {"error": "Transaction failed."})
+        raise Exception("Transaction failed.")
+
+    # Insert hash and the transaction's pending operations into database
+    insert_transaction_into_database(hash)
+    finish_submission(hash, "successful", {"ledger": submit_response.get("ledger")})
+    return hash
+
+
+def wait_for_submission(hash):
+    """
+    Waits (at most SUBMISSION_TIMEOUT seconds) for another worker to finish submitting a transaction.
+
+    Params:
+        hash (str): the transaction hash.
+
+    Returns:
+        Success: a string with the transaction hash.
+        Failure: raises the error the submission failed with.
+    """
+    deadline = time.monotonic() + SUBMISSION_TIMEOUT
+
+    while time.monotonic() < deadline:
+        submission = get_submission(hash)
+        if submission["status"] == "successful":
+            return hash
+        if submission["status"] == "failed":
+            raise Exception(submission["result"].get("error", "Transaction failed."))
+        time.sleep(0.5)
+
+    raise Exception("Timed out waiting for the transaction to be submitted.")
+
+
+def enqueue_submission(signed_transactions):
+    """
+    Queues signed transactions to be submitted in the background, in the given order,
+    so the request doesn't wait for Horizon. Its progress is followed with get_submission_batch.
+
+    Params:
+        signed_transactions (list): signed transactions in XDR format.
+
+    Returns:
+        str: the submission batch id.
+    """
+    # Read the hashes now, so malformed transactions are refused before being queued
+    hashes = [transaction_hash(signed_transaction) for signed_transaction in signed_transactions]
+
+    # Store the transactions with the batch, so it survives a restart of this worker process
+    batch_id = secrets.token_hex(16)
+    query = """
+        INSERT INTO submission_batches (id, public_key, status, hashes, transactions, created_at, updated_at)
+        VALUES (?, ?, 'queued', ?, ?, ?, ?)
+    """
+    params = (batch_id, session["public_key"], json.dumps(hashes), json.dumps(signed_transactions),
+              datetime.now(), datetime.now())
+    write_query(query, params)
+
+    start_submission_workers()
+    submission_queue.put(batch_id)
+    return batch_id
+
+
+def get_submission_batch(batch_id):
+    """
+    Looks up the progress of a submission batch. A batch no worker has moved forward for SUBMISSION_TIMEOUT seconds
+    is marked as failed (it can't be claimed anymore, so the user can safely sign and send it again).
+
+    Params:
+        batch_id (str): the id returned by enqueue_submission.
+
+    Returns:
+        dict: the batch ('status' is 'queued', 'submitting', 'successful' or 'failed', 'hashes' lists
+        the hashes of the transactions already submitted), or None if it doesn't exist.
+    """
+    batches = fetch_query("SELECT * FROM submission_batches WHERE id = ?", batch_id, cache=False)
+    if not batches:
+        return None
+
+    batch = batches[0]
+    if batch["status"] in ("queued", "submitting"):
+        query = """
+            UPDATE submission_batches SET status = 'failed', error = ?, updated_at = ?
+            WHERE id = ? AND status IN ('queued', 'submitting') AND updated_at < ?
+        """
+        params = ("Timed out waiting for the transactions to be submitted.", datetime.now(), batch_id,
+                  datetime.now() - timedelta(seconds=SUBMISSION_TIMEOUT))
+        if write_query(query, params):
+            return get_submission_batch(batch_id)
+
+    batch["hashes"] = json.loads(batch["hashes"])[:batch["submitted"]]
+    return batch
+
+
+def update_submission_batch(batch_id, status, submitted, error=None):
+    """
+    Stores the progress of a submission batch claimed by the caller.
+    Nothing is written if the batch is no longer being submitted: get_submission_batch failed it
+    after SUBMISSION_TIMEOUT seconds without progress (and the user may have sent it again).
+
+    Params:
+        batch_id (str): the batch id.
+        status (str): 'submitting', 'successful' or 'failed'.
+        submitted (int): number of transactions of the batch already submitted.
+        error (str, optional): why the batch failed.
+
+    Returns:
+        bool: True if the progress was stored, False if the caller must stop submitting the batch.
+    """
+    query = """
+        UPDATE submission_batches SET status = ?, submitted = ?, error = ?, updated_at = ?
+        WHERE id = ? AND status = 'submitting'
+    """
+    return write_query(query, (status, submitted, error, datetime.now(), batch_id)) == 1
+
+
+def claim_submission_batch(batch_id):
+    """
+    Registers a batch as being submitted by the caller, unless another worker (maybe in another process)
+    already is (or did). Batches left 'submitting' by a worker that stopped can be claimed after SUBMISSION_TIMEOUT.
+
+    Params:
+        batch_id (str): the batch id.
+
+    Returns:
+        dict: the claimed batch, or None if the caller must not submit it.
+    """
+    now = datetime.now()
+    query = """
+        UPDATE submission_batches SET status = 'submitting', updated_at = ?
+        WHERE id = ? AND (status = 'queued' OR (status = 'submitting' AND updated_at < ?))
+    """
+    if write_query(query, (now, batch_id, now - timedelta(seconds=SUBMISSION_TIMEOUT))) != 1:
+        return None
+    return fetch_query("SELECT * FROM submission_batches WHERE id = ?", batch_id, cache=False)[0]
+
+
+def process_submission_batch(batch_id):
+    """
+    Submits the transactions of a batch in order, stopping at the first failed one
+    (the following ones depend on its sequence number). A batch resumed after a restart
+    continues from the first transaction not yet submitted.
+
+    Params:
+        batch_id (str): the batch id.
+    """
+    batch = claim_submission_batch(batch_id)
+    if batch is None:
+        return
+
+    # Batches queued before their transactions were stored can't be resumed
+    if not batch["transactions"]:
+        update_submission_batch(batch_id, "failed", batch["submitted"], "The transactions were lost, please try again.")
+        return
+
+    signed_transactions = json.loads(batch["transactions"])
+
+    for transaction_index, signed_transaction in enumerate(signed_transactions):
+        if transaction_index < batch["submitted"]:
+            continue
+
+        try:
+            submit_payment_transaction(signed_transaction)
+        except Exception as e:
+            print(f"Error submitting batch {batch_id}: {str(e)}")
+            update_submission_batch(batch_id, "failed", transaction_index,
+                                    f"Transaction {transaction_index + 1} of {len(signed_transactions)} failed: {str(e)}")
+            return
+
+        # Stop if the batch was failed meanwhile (this worker took longer than SUBMISSION_TIMEOUT)
+        if not update_submission_batch(batch_id, "submitting", transaction_index + 1):
+            print(f"Stopped submitting batch {batch_id}: it timed out.")
+            return
+
+    update_submission_batch(batch_id, "successful", len(signed_transactions))
+
+
+@own_connection
+def submission_worker():
+    """
+    Background loop submitting the queued batches.
+    """
+    while True:
+        batch_id = submission_queue.get()
+        try:
+            process_submission_batch(batch_id)
+        except Exception as e:
+            print(f"Unexpected error in submission worker: {str(e)}")
+        finally:
+            submission_queue.task_done()
+
+
+def start_submission_workers():
+    """
+    Starts the background submission workers (SUBMISSION_WORKERS threads) once per worker process,
+    queuing again the batches left unfinished by a process that stopped (a batch still being submitted
+    by another process can't be claimed, see claim_submission_batch).
+
+    Returns:
+        None
+    """
+    global submission_workers_pid
+
+    with submission_workers_lock:
+        if submission_workers_pid == os.getpid():
+            return
+        submission_workers_pid = os.getpid()
+
+    for i in range(SUBMISSION_WORKERS):
+        threading.Thread(target=submission_worker, name=f"submission-worker-{i}", daemon=True).start()
+
+    try:
+        unfinished = fetch_query(
+            "SELECT id FROM submission_batches WHERE status IN ('queued', 'submitting') ORDER BY created_at", cache=False)
+    except Exception as e:
+        print(f"Error reading unfinished submission batches: {str(e)}")
+        return
+
+    for batch in unfinished:
+        submission_queue.put(batch["id"])
+
+
+""" INGESTION """
+
+# Process following the admin account's payments (one ingester thread per worker process)
+payment_ingester_pid = None
+payment_ingester_lock = threading.Lock()
+
+
+def get_ingest_cursor(name):
+    """
+    Returns the paging_token of the last record processed by an ingester.
+
+    Params:
+        name (str): the cursor's name.
+
+    Returns:
+        str: the paging token, or None if nothing was ingested yet.
+    """
+    cursors = fetch_query("SELECT cursor FROM ingest_cursors WHERE name = ?", name, cache=False)
+    return cursors[0]["cursor"] if cursors else None
+
+
+def ingest_payments(name, payments):
+    """
+    Records the transactions of the given payments that never reached the ledger (the browser didn't call /send_transaction),
+    matching them to their pending operations by transaction hash, and moves the cursor past the payments,
+    all in a single database transaction. Payments already recorded or not built by this app are skipped.
+
+    Params:
+        name (str): the cursor's name.
+        payments (list): payment records from Horizon, oldest first.
+
+    Returns:
+        int: number of transactions recorded.
+    """
+    if not payments:
+        return 0
+
+    # Only transactions built by this app and not recorded yet still have pending operations
+    hashes = list(dict.fromkeys(
+        payment["transaction_hash"] for payment in payments
+        if payment.get("type") == "payment" and payment.get("transaction_successful", True)
+    ))
+    pending_hashes = []
+    if hashes:
+        placeholders = ", ".join("?" * len(hashes))
+        query = f"SELECT DISTINCT transaction_hash FROM pending_operations WHERE transaction_hash IN ({placeholders})"
+        pending_hashes = [row["transaction_hash"] for row in fetch_query(query, tuple(hashes), cache=False)]
+
+    now = datetime.now()
+    statements = build_ledger_statements(pending_hashes) if pending_hashes else []
+    statements += [
+        # Repeated /send_transaction of these transactions are answered from the submission registry
+        (
+            """
+            INSERT INTO submissions (transaction_hash, status, result, created_at, updated_at)
+            VALUES (?, 'successful', ?, ?, ?)
+            ON CONFLICT (transaction_hash) DO UPDATE SET
+            status = 'successful', result = excluded.result, updated_at = excluded.updated_at
+            """,
+            [(hash, json.dumps({"ingested": True}), now, now) for hash in pending_hashes]
+        ),
+        # Move the cursor (never backwards, several worker processes may follow the same account)
+        (
+            """
+            INSERT INTO ingest_cursors (name, cursor, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET cursor = excluded.cursor, updated_at = excluded.updated_at
+            WHERE CAST(excluded.cursor AS INTEGER) > CAST(cursor AS INTEGER)
+            """,
+            [(name, payments[-1]["paging_token"], now)]
+        ),
+    ]
+    write_batch_query(statements)
+    return len(pending_hashes)
+
+
+def sync_payments(account_id):
+    """
+    Catches up with an account's payments page by page, from the saved cursor to the latest payment.
+
+    Params:
+        account_id (str): the account's public key.
+
+    Returns:
+        int: number of transactions recorded.
+    """
+    name = f"payments:{account_id}"
+    recorded = 0
+
+    while True:
+        payments = fetch_payments(account_id, get_ingest_cursor(name))
+        if not payments:
+            return recorded
+        recorded += ingest_payments(name, payments)
+
+
+@own_connection
+def follow_payments(account_id):
+    """
+    Background loop: catches up with an account's payments, then records new ones as Horizon streams them.
+    Connection errors restart it (from the saved cursor) after INGEST_RETRY_DELAY seconds.
+
+    Params:
+        account_id (str): the account's public key.
+    """
+    name = f"payments:{account_id}"
+
+    while True:
+        try:
+            sync_payments(account_id)
+            for payment in stream_payments(account_id, get_ingest_cursor(name) or "now"):
+                ingest_payments(name, [payment])
+        except Exception as e:
+            print(f"Error ingesting payments: {str(e)}")
+        time.sleep(INGEST_RETRY_DELAY)
+
+
+def start_payment_ingester():
+    """
+    Starts following the admin account's payments once per worker process.
+
+    Returns:
+        None
+    """
+    global payment_ingester_pid
+
+    with payment_ingester_lock:
+        if payment_ingester_pid == os.getpid():
+            return
+        payment_ingester_pid = os.getpid()
+
+    threading.Thread(target=follow_payments, args=(admin_account,), name="payment-ingester", daemon=True).start()
 
 
 """ CALCULATE """
@@ -212,11 +809,15 @@ def calculate_total_donations(projects_list):
         list: the updated list of project dictionaries including total donations.
     """
 
+    if not projects_list:
+        return projects_list
+
     try:
-        # Sum donations by project id
-        query = "SELECT project_id, SUM(amount) as donations FROM transactions WHERE type = ? GROUP BY project_id"
-        params = ("donation",)
-        total_donations = fetch_query(query, params)
+        # Read the totals maintained by the project_totals triggers, only for the given projects (no aggregation)
+        project_ids = tuple(dict.fromkeys(project["project_id"] for project in projects_list))
+        placeholders = ", ".join("?" * len(project_ids))
+        query = f"SELECT project_id, total_donated AS donations FROM project_totals WHERE project_id IN ({placeholders})"
+        total_donations = fetch_query(query, project_ids)
 
         # Convert results into a dict mapping projects id to total donations
         donations_dict = {row['project_id']: row['donations'] for row in total_donations}
@@ -270,8 +871,9 @@ def calculate_project_progress(projects_list):
     """
     
     try:
-        # Calculate sum of donations per project
-        projects_list = calculate_total_donations(projects_list)
+        # Searches already join project_totals, look totals up only for lists that don't have them
+        if any("total_donations" not in project for project in projects_list):
+            projects_list = calculate_total_donations(projects_list)
 
         for project in projects_list:
 
@@ -397,54 +999,230 @@ def search_donations_history():
         return []
 
 
-def search_projects(name="", category="", status=""):
+def build_match_query(text):
     """
-    Searches for projects data based on optional parameters such as project's name, category and status.
-    It integrates additional processing like calculating project days left and project funding progress.
+    Converts the text typed in the search bar into an FTS5 query where every word is matched as a prefix.
 
     Params:
-        name (str, optional): filter by the project's name. Defaults to an empty string.
-        category (str, optional): filter by the project's category. Defaults to an empty string.
-        status (str, optional): filter by the project's status. Defaults to an empty string.
+        text (str): the search text inputed by the user.
 
     Returns:
-        list: detailed list of project dictionaries or empty list.
+        str: FTS5 MATCH expression (e.g. '"spa"* "bit"*'), or an empty string if the text has no words.
     """
 
-    projects_list = []
+    # Quoting each word prevents FTS5 operators and syntax errors from user input
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words)
 
-    try:
-        # Fetch all projects that correspond to the criteria
-        query ="""
-            SELECT id AS project_id, name, category, status, public_key, 
-            expire_date, goal, image_path, description FROM projects 
-            WHERE name LIKE ? AND category LIKE ? AND status LIKE ? 
-            ORDER BY created_at DESC, status
-        """
-        params = ("%" + name + "%", "%" + category + "%", "%" + status + "%")
 
-        projects_list = fetch_query(query, params)
+def build_projects_filter(name="", category="", status="", owner=""):
+    """
+    Builds the WHERE clause shared by project searches and summaries, using only the criteria that were given.
 
-        # Calculate the amount of days left for each project
-        projects_list = calculate_project_days_left(projects_list)
+    Params:
+        name (str, optional): words of the project's name or description.
+        category (str, optional): exact project's category.
+        status (str, optional): exact project's status.
+        owner (str, optional): creator's public key.
 
-        # Format friendly date
-        for project in projects_list:
-            project["expire_date"] = format_date(project["expire_date"], "medium_string")
+    Returns:
+        tuple: the conditions list and the params list, both to be used with the projects table aliased as p.
+    """
 
-        # Calculate the current percentage of funding reached
-        return calculate_project_progress(projects_list)
+    # Exact matches can use the projects indexes
+    conditions = []
+    params = []
+
+    if name:
+        match_query = build_match_query(name)
+
+        # Full-text search when there are words to match, plain substring otherwise (e.g. only symbols)
+        if match_query:
+            conditions.append("p.id IN (SELECT rowid FROM projects_fts WHERE projects_fts MATCH ?)")
+            params.append(match_query)
+        else:
+            conditions.append("p.name LIKE ?")
+            params.append("%" + name + "%")
+    if category:
+        conditions.append("p.category = ?")
+        params.append(category)
+    if status:
+        conditions.append("p.status = ?")
+        params.append(status)
+    if owner:
+        conditions.append("p.public_key = ?")
+        params.append(owner)
+
+    return conditions, params
+
+
+def search_projects(name="", category="", status="", owner="", cursor=None, limit=None, cache=True):
+    """
+    Searches for projects data based on optional parameters such as project's name, category, status and owner.
+    It integrates additional processing like calculating project days left and project funding progress.
+    Projects are ordered from newest to oldest (or by relevance when searching by name),
+    so a page can continue after the last project of the previous one.
+
+    Params:
+        name (str, optional): full-text search on the project's name and description,
+        every word is matched as a prefix. Defaults to an empty string.
+        category (str, optional): filter by the exact project's category. Defaults to an empty string.
+        status (str, optional): filter by the exact project's status. Defaults to an empty string.
+        owner (str, optional): filter by the creator's public key. Defaults to an empty string.
+        cursor (int, optional): ID of the last project already shown, only older projects are returned.
+        limit (int, optional): maximum number of projects returned. Defaults to all of them.
+        cache (bool, optional): False to read the database directly, for checks deciding whether money moves
+        (other worker processes' writes may take QUERY_CACHE_TTL seconds to reach the query cache).
+
+    Returns:
+        list: detailed list of project dictionaries or empty list.
+    """
+
+    projects_list = []
+
+    try:
+        match_query = build_match_query(name)
+
+        if match_query:
+            # Name searches join the full-text index to rank projects by relevance (bm25)
+            conditions, params = build_projects_filter("", category, status, owner)
+            join_clause = "JOIN projects_fts f ON f.rowid = p.id"
+            conditions.insert(0, "projects_fts MATCH ?")
+            params.insert(0, match_query)
+            order_clause = "ORDER BY f.rank, p.id"
+
+            # Keyset pagination: continue right after the (rank, id) of the cursor project
+            if cursor:
+                conditions.append("""(f.rank, p.id) > (
+                    (SELECT rank FROM projects_fts WHERE projects_fts MATCH ? AND rowid = ?), ?)""")
+                params.extend([match_query, cursor, cursor])
+        else:
+            conditions, params = build_projects_filter(name, category, status, owner)
+            join_clause = ""
+            order_clause = "ORDER BY p.created_at DESC, p.id DESC"
+
+            # Keyset pagination: continue right after the (created_at, id) of the cursor project
+            if cursor:
+                conditions.append("(p.created_at, p.id) < (SELECT created_at, id FROM projects WHERE id = ?)")
+                params.append(cursor)
+
+        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+        limit_clause = ""
+        if limit:
+            limit_clause = "LIMIT ?"
+            params.append(limit)
+
+        # Fetch all projects that correspond to the criteria
+        query =f"""
+            SELECT p.id AS project_id, p.name, p.category, p.status, p.public_key, 
+            p.expire_date, p.goal, p.image_path, p.description,
+            COALESCE(t.total_donated, 0) AS total_donations, COALESCE(v.version, 0) AS version FROM projects p
+            {join_clause}
+            LEFT JOIN project_totals t ON t.project_id = p.id
+            LEFT JOIN project_versions v ON v.project_id = p.id
+            {where_clause}
+            {order_clause}
+            {limit_clause}
+        """
+        params = tuple(params)
+
+        projects_list = fetch_query(query, params, cache)
+
+        # Calculate the amount of days left for each project
+        projects_list = calculate_project_days_left(projects_list)
+
+        # Format friendly date
+        for project in projects_list:
+            project["expire_date"] = format_date(project["expire_date"], "medium_string")
+
+        # Calculate the current percentage of funding reached
+        return calculate_project_progress(projects_list)
     except Exception as e:
         print("Error searching projects:", str(e))
         return []
 
 
-def search_project_by_id(id):
+def search_projects_page(name="", category="", status="", owner="", cursor=None):
+    """
+    Searches for one page of projects (PROJECTS_PAGE_SIZE at most) with the same filters as search_projects.
+
+    Params:
+        name, category, status, owner (str, optional): filters passed to search_projects.
+        cursor (int, optional): ID of the last project of the previous page.
+
+    Returns:
+        tuple: the list of project dictionaries and the cursor of the next page (None on the last page).
+    """
+
+    # Fetch one extra project to know whether there is a next page
+    projects_list = search_projects(name, category, status, owner, cursor, PROJECTS_PAGE_SIZE + 1)
+
+    next_cursor = None
+    if len(projects_list) > PROJECTS_PAGE_SIZE:
+        projects_list = projects_list[:PROJECTS_PAGE_SIZE]
+        next_cursor = projects_list[-1]["project_id"]
+
+    return projects_list, next_cursor
+
+
+def summarize_projects(name="", category="", status="", owner=""):
+    """
+    Aggregates the numbers shown on the info cards for every project matching the filters,
+    so paginated pages don't need the full list of projects.
+
+    Params:
+        name, category, status, owner (str, optional): filters passed to build_projects_filter.
+
+    Returns:
+        dict: projects, active and successful counts, total donations and total goal.
+    """
+
+    conditions, params = build_projects_filter(name, category, status, owner)
+    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    query = f"""
+        SELECT COUNT(*) AS projects_count,
+        COALESCE(SUM(p.status = 'active'), 0) AS active_count,
+        COALESCE(SUM(p.status = 'successful'), 0) AS successful_count,
+        COALESCE(SUM(t.total_donated), 0) AS total_donations,
+        COALESCE(SUM(p.goal), 0) AS total_goal
+        FROM projects p LEFT JOIN project_totals t ON t.project_id = p.id
+        {where_clause}
+    """
+    summary = fetch_query(query, tuple(params))
+
+    if not summary:
+        return {"projects_count": 0, "active_count": 0, "successful_count": 0, "total_donations": 0, "total_goal": 0}
+    return summary[0]
+
+
+def search_admin_projects(name="", category="", status=""):
+    """
+    Searches the control panel data that isn't paginated: every project waiting to be funded or refunded
+    (so the admin can select all of them) and the info cards totals.
+
+    Params:
+        name, category, status (str, optional): filters inputed on the control panel search bar.
+
+    Returns:
+        dict: fund_projects and refund_projects lists, and the projects_summary dict.
+    """
+    return {
+        "fund_projects": search_projects(name, category, "fund") if status in ("", "fund") else [],
+        "refund_projects": search_projects(name, category, "refund") if status in ("", "refund") else [],
+        "projects_summary": summarize_projects(name, category, status)
+    }
+
+
+def search_project_by_id(id, cache=True):
     """
     Searches for a project by its ID.
     It integrates additional processing like calculating project days left and project funding progress.
 
-    Params: id (int)
+    Params:
+        id (int): the project's ID.
+        cache (bool, optional): False to read the database directly, for checks deciding what happens to donations
+        (see search_projects).
 
     Returns:
         dict: project data.
@@ -452,12 +1230,14 @@ def search_project_by_id(id):
     try:
         # Fetch project info from database
         query ="""
-            SELECT id AS project_id, name, category, status, public_key, 
-            expire_date, goal, image_path, description FROM projects 
-            WHERE id = ? 
+            SELECT p.id AS project_id, p.name, p.category, p.status, p.public_key, 
+            p.expire_date, p.goal, p.image_path, p.description,
+            COALESCE(t.total_donated, 0) AS total_donations FROM projects p
+            LEFT JOIN project_totals t ON t.project_id = p.id
+            WHERE p.id = ? 
         """
         params = (id,)
-        projects = fetch_query(query, params)
+        projects = fetch_query(query, params, cache)
 
         # Deal with unexistent project
         if not projects:
@@ -478,7 +1258,8 @@ def search_project_by_id(id):
 
 def search_refund_operations(projects_list):
     """
-    Searches for total donation amounts per donor for each project in a provided list.
+    Searches for total donation amounts per donor for each project in a provided list,
+    minus what was already refunded to the donor (a refund batch may have been only partially submitted).
 
     Params:
         projects_list (list): list of project dictionaries, each containing project details.
@@ -488,29 +1269,27 @@ def search_refund_operations(projects_list):
         Contains the project ID, donor's public key, and total amount to be refunded.
     """
 
-    refundable_projects = []
+    if not projects_list:
+        return []
 
     try:
-        for project in projects_list:
-
-            # Fetch total donations by donor for the project to build an operation
-            query = """
-                SELECT project_id, public_key_sender AS public_key,
-                SUM(amount) AS total_donations 
-                FROM transactions
-                WHERE project_id = ? AND type = ?
-                GROUP BY public_key_sender
-            """
-            params = (project["project_id"], "donation")
-            donations_by_donor = fetch_query(query, params)
-            
-            # Add project name to each operation
-            for operation in donations_by_donor:
-                operation["name"] = project["name"]
+        # Fetch total donations not yet refunded by donor for every project at once
+        placeholders = ", ".join("?" * len(projects_list))
+        query = f"""
+            SELECT t.project_id, p.name,
+            CASE WHEN t.type = 'donation' THEN t.public_key_sender ELSE t.public_key_receiver END AS public_key,
+            SUM(CASE WHEN t.type = 'donation' THEN t.amount ELSE -t.amount END) AS total_donations
+            FROM transactions t
+            JOIN projects p ON p.id = t.project_id
+            WHERE t.type IN (?, ?) AND t.project_id IN ({placeholders})
+            GROUP BY t.project_id, CASE WHEN t.type = 'donation' THEN t.public_key_sender ELSE t.public_key_receiver END
+            HAVING total_donations > 0
+            ORDER BY t.project_id
+        """
+        params = ("donation", "refund", *[project["project_id"] for project in projects_list])
 
-            # Update final list of doners to be refunded
-            refundable_projects.extend(donations_by_donor)
-        return refundable_projects
+        # Refunds are paid from this result, so it's always read fresh
+        return fetch_query(query, params, cache=False)
     except Exception as e:
         raise Exception(f"Error searching refund operations: {str(e)}")
 
@@ -527,8 +1306,10 @@ def search_supported_projects():
 
         # Fetch sum of donations by project
         query = """
-            SELECT t.project_id, p.name, p.category, p.status, p.goal, SUM(amount) AS your_donations FROM transactions t 
+            SELECT t.project_id, p.name, p.category, p.status, p.goal, SUM(t.amount) AS your_donations,
+            COALESCE(pt.total_donated, 0) AS total_donations FROM transactions t 
             JOIN projects p ON t.project_id = p.id 
+            LEFT JOIN project_totals pt ON pt.project_id = t.project_id
             WHERE t.public_key_sender = ? AND t.type = ? GROUP BY t.project_id ORDER BY p.status
         """
         params = (session["public_key"], "donation")
@@ -541,8 +1322,132 @@ def search_supported_projects():
         return []
 
 
+""" SUGGESTIONS """
+
+# In-process prefix index for the search bar typeahead: sorted (key, name, project_id) entries,
+# one per project name and one per word of the name, so "bit" suggests "Space Bites"
+suggest_index = []
+suggest_keys_by_project = {}
+suggest_index_loaded_at = None
+suggest_index_lock = threading.Lock()
+
+
+def build_suggest_keys(name):
+    """
+    Builds the lowercase keys a project name can be found by: the full name and each of its words.
+
+    Params:
+        name (str): the project's name.
+
+    Returns:
+        set: index keys for the name.
+    """
+    name = name.lower().strip()
+    return {name, *name.split()}
+
+
+def load_suggest_index():
+    """
+    Rebuilds the typeahead prefix index from every project name in the database.
+    Other worker processes don't see incremental updates, so the index is also rebuilt every SUGGEST_INDEX_TTL seconds.
+
+    Returns:
+        None
+    """
+    global suggest_index, suggest_keys_by_project, suggest_index_loaded_at
+
+    entries = []
+    keys_by_project = {}
+
+    for project in fetch_query("SELECT id, name FROM projects"):
+        keys = build_suggest_keys(project["name"])
+        keys_by_project[project["id"]] = keys
+        entries.extend((key, project["name"], project["id"]) for key in keys)
+
+    with suggest_index_lock:
+        suggest_index = sorted(entries)
+        suggest_keys_by_project = keys_by_project
+        suggest_index_loaded_at = time.monotonic()
+
+
+def update_suggest_index(project_id, name):
+    """
+    Replaces the entries of one project in the typeahead index after it is created or renamed.
+
+    Params:
+        project_id (int): the project's ID.
+        name (str): the project's current name.
+
+    Returns:
+        None
+    """
+    project_id = int(project_id)
+
+    with suggest_index_lock:
+
+        # Drop the entries of the previous name
+        for key in suggest_keys_by_project.pop(project_id, set()):
+            position = bisect.bisect_left(suggest_index, (key,))
+            while position < len(suggest_index) and suggest_index[position][0] == key:
+                if suggest_index[position][2] == project_id:
+                    del suggest_index[position]
+                else:
+                    position += 1
+
+        # Insert the entries of the new name in sorted position
+        keys = build_suggest_keys(name)
+        suggest_keys_by_project[project_id] = keys
+        for key in keys:
+            bisect.insort(suggest_index, (key, name, project_id))
+
+
+def suggest_projects(prefix):
+    """
+    Finds project names and categories starting with the given prefix, for the search bar typeahead.
+
+    Params:
+        prefix (str): the text typed so far.
+
+    Returns:
+        list: up to SUGGEST_LIMIT dictionaries with type ('project' or 'category'), name and project_id.
+    """
+    prefix = prefix.lower().strip()
+    if not prefix:
+        return []
+
+    # Load the index on first use and refresh it when it gets old
+    if suggest_index_loaded_at is None or time.monotonic() - suggest_index_loaded_at > SUGGEST_INDEX_TTL:
+        load_suggest_index()
+
+    suggestions = [
+        {"type": "category", "name": category, "project_id": None}
+        for category in categories_list if category.startswith(prefix)
+    ]
+    seen_projects = set()
+
+    with suggest_index_lock:
+
+        # Entries sharing the prefix are contiguous in the sorted index
+        position = bisect.bisect_left(suggest_index, (prefix,))
+        while position < len(suggest_index) and len(suggestions) < SUGGEST_LIMIT:
+            key, name, project_id = suggest_index[position]
+            if not key.startswith(prefix):
+                break
+            if project_id not in seen_projects:
+                seen_projects.add(project_id)
+                suggestions.append({"type": "project", "name": name, "project_id": project_id})
+            position += 1
+
+    return suggestions[:SUGGEST_LIMIT]
+
+
 """ UPDATES """
 
+# Expiry scheduler of this worker process, sleeping until the next project expires
+expiry_scheduler_pid = None
+expiry_scheduler_lock = threading.Lock()
+expiry_wakeup = threading.Event()
+
 def insert_project_into_database(project, file_url):
     """
     Inserts a new project into the database using provided project details and an image URL.
@@ -577,131 +1482,465 @@ def insert_project_into_database(project, file_url):
         # Fetch and return the ID of the newly inserted project
         query = "SELECT id FROM projects ORDER BY created_at DESC LIMIT 1"
         result = fetch_query(query)
+
+        # Make the new name available to the search bar typeahead, and schedule its expiry
+        update_suggest_index(result[0]["id"], project["name"])
+        wake_expiry_scheduler()
         return result[0]["id"]
     except Exception as e:
         print(str(e))
         return str(e)
         
 
+def build_ledger_statements(hashes):
+    """
+    Builds the statements recording the pending operations of submitted transactions in the transactions table
+    and adjusting project statuses following administrative fund or refund actions, to be run with write_batch_query.
+    Everything is read inside the write itself, so the ledger rows, the new statuses and the cleared pending operations
+    are committed together or not at all.
+
+    Params:
+        hashes (list): the transactions hashes, used to find their pending operations and recorded with each transaction entry.
+
+    Returns:
+        list: list of (query, params_list) tuples.
+    """
+    statements = []
+
+    # Each transaction is recorded, settles its projects and clears its operations before the next one,
+    # so the last transaction of a batch finds the others already gone
+    for hash in hashes:
+        statements += [
+            # Copy the pending operations into the transactions table (the sender is the account that signed
+            # the transaction, the receiver is the admin for donations, the project's creator or the donor otherwise).
+            # A concurrent retry finds them already gone, and the unique (hash, op_index) index ignores
+            # any operation already recorded
+            (
+                """
+                INSERT INTO transactions
+                (project_id, amount, public_key_sender, public_key_receiver, hash, op_index, type, timestamp)
+                SELECT project_id, amount, source_account,
+                CASE WHEN type = 'donation' THEN ? ELSE destination_account END,
+                transaction_hash, ROW_NUMBER() OVER (ORDER BY id) - 1, type, ?
+                FROM pending_operations WHERE transaction_hash = ? ORDER BY id
+                ON CONFLICT (hash, op_index) DO NOTHING
+                """,
+                [(admin_account, datetime.now(), hash)]
+            ),
+            # Set the new status of the projects funded or refunded by the transaction, unless other transactions
+            # of the same batch still carry operations for them (the project keeps its fund/refund status,
+            # so the admin can finish the payments if one of them fails)
+            (
+                """
+                UPDATE projects SET status = CASE WHEN EXISTS (
+                    SELECT 1 FROM pending_operations
+                    WHERE transaction_hash = ? AND project_id = projects.id AND type = 'fund'
+                ) THEN 'successful' ELSE 'unsuccessful' END
+                WHERE id IN (
+                    SELECT project_id FROM pending_operations WHERE transaction_hash = ? AND type IN ('fund', 'refund')
+                ) AND NOT EXISTS (
+                    SELECT 1 FROM pending_operations
+                    WHERE batch_id = (SELECT batch_id FROM pending_operations WHERE transaction_hash = ? LIMIT 1)
+                    AND transaction_hash != ? AND project_id = projects.id AND type IN ('fund', 'refund')
+                )
+                """,
+                [(hash, hash, hash, hash)]
+            ),
+            # The transaction is now in the ledger, its operations are no longer pending
+            ("DELETE FROM pending_operations WHERE transaction_hash = ?", [(hash,)]),
+        ]
+
+    return statements
+
+
 def insert_transaction_into_database(hash):
     """
     Updates the transactions table with the transaction data and adjusts project statuses following administrative fund or refund actions.
+    Everything is written in a single database transaction, which also clears the pending operations:
+    recording the same hash again (a retried submission) writes nothing.
 
     Params:
-        hash (str): the transaction hash to be recorded with each transaction entry.
+        hash (str): the transaction hash, used to find its pending operations and recorded with each transaction entry.
 
     Returns:
         None
     """
     try:
-        # Fetch ongoing transactions from temporary table
-        temp_table = fetch_query("SELECT * FROM temp_operations")
+        write_batch_query(build_ledger_statements([hash]))
+    except Exception as e:
+        print(str(e))
+        raise Exception(f"Error updating transactions database: {str(e)}")
 
-        # TODO: this is stupid, I'm doing that twice, its easier just to store the keys in the temp table
-        for operation in temp_table:
 
-            if operation["type"] == "donation":
-                public_key_sender = session["public_key"]
+def update_expired_projects_statuses():
+    """
+    Updates the status of projects based on their expiry date and total donations compared to their goals.
+    Only the active projects already expired are changed, in a single UPDATE statement: when several worker processes
+    run it at the same time, the first one transitions the projects and the others find nothing left to do.
 
-                # Donations are tranferred to the admin account
-                public_key_receiver = admin_account
+    Returns:
+        bool: True if the status update operation is successful for all projects, False otherwise.
+    """
+    try:
+        # Projects without donations pass directly to unsuccessful, projects that achieved their goal
+        # will be funded by admin, and donations are refunded when project doesn't meet the goal
+        query = """
+            UPDATE projects SET status = CASE
+                WHEN COALESCE((SELECT total_donated FROM project_totals WHERE project_id = projects.id), 0) = 0
+                    THEN 'unsuccessful'
+                WHEN (SELECT total_donated FROM project_totals WHERE project_id = projects.id) >= goal
+                    THEN 'fund'
+                ELSE 'refund'
+            END
+            WHERE status = 'active' AND expire_date < ?
+        """
+        write_query(query, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        return True
+    except Exception as e:
+        print(f"Error changing status: {str(e)}")
+        return False
 
-            else:
-                # Fund and refund transactions must be sended by admin
-                public_key_sender = admin_account
 
-                # Receiver for funding is project's creator and for refunding is the donor
-                public_key_receiver = operation["destination_account"]
+def seconds_until_next_expiry():
+    """
+    Finds how long until the next active project expires.
 
-                # Set new status for projects that are being funded or refunded
-                if operation["type"] == "fund":
-                    new_status = "successful"
-                else:
-                    new_status = "unsuccessful"
+    Returns:
+        float: seconds until the next expiry (at most EXPIRY_CHECK_MAX_SLEEP, also when no project is active).
+    """
+    projects = fetch_query("SELECT MIN(expire_date) AS expire_date FROM projects WHERE status = 'active'", cache=False)
+    if not projects or projects[0]["expire_date"] is None:
+        return EXPIRY_CHECK_MAX_SLEEP
 
-                # Update project status
-                query = "UPDATE projects SET status = ? WHERE id = ?"
-                params = (new_status, operation["project_id"])
-                write_query(query, params)
+    # Expire dates have second precision, wake up once the second has passed
+    expire_date = datetime.strptime(projects[0]["expire_date"], "%Y-%m-%d %H:%M:%S")
+    seconds = (expire_date - datetime.now()).total_seconds() + 1
+    return min(max(seconds, 0), EXPIRY_CHECK_MAX_SLEEP)
 
-            # Insert transaction data into the transactions table
-            query = """
-            INSERT INTO transactions (project_id, amount, public_key_sender, public_key_receiver, hash, type, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            params = (
-                    operation["project_id"],
-                    operation["amount"],
-                    public_key_sender,
-                    public_key_receiver,
-                    hash,
-                    operation["type"],
-                    datetime.now()
-            )
-            write_query(query, params)
+
+@own_connection
+def expiry_scheduler():
+    """
+    Background loop moving projects to fund, refund or unsuccessful as soon as they expire.
+    It sleeps until the next expire date, or less: every EXPIRY_CHECK_MAX_SLEEP seconds at most
+    (projects may be created by other worker processes) and when woken by wake_expiry_scheduler.
+    """
+    while True:
+        try:
+            update_expired_projects_statuses()
+            delay = seconds_until_next_expiry()
+        except Exception as e:
+            print(f"Error in expiry scheduler: {str(e)}")
+            delay = EXPIRY_CHECK_MAX_SLEEP
+
+        expiry_wakeup.wait(delay)
+        expiry_wakeup.clear()
+
+
+def wake_expiry_scheduler():
+    """
+    Makes the expiry scheduler of this worker process look for the next expire date again
+    (after a project is created or its expire date is changed).
+
+    Returns:
+        None
+    """
+    expiry_wakeup.set()
+
+
+def start_expiry_scheduler():
+    """
+    Starts the expiry scheduler once per worker process.
+
+    Returns:
+        None
+    """
+    global expiry_scheduler_pid
+
+    with expiry_scheduler_lock:
+        if expiry_scheduler_pid == os.getpid():
+            return
+        expiry_scheduler_pid = os.getpid()
+
+    threading.Thread(target=expiry_scheduler, name="expiry-scheduler", daemon=True).start()
+
+
+def rebuild_project_totals():
+    """
+    Recomputes the project_totals table from the donations recorded in the transactions table.
+    Used to repair the totals if the triggers were bypassed (e.g. rows edited by hand).
+
+    Returns:
+        None
+    """
+    try:
+        # Overwrite the totals of every project that received donations
+        write_query("""
+            INSERT OR REPLACE INTO project_totals (project_id, total_donated, donor_count, last_donation_at)
+            SELECT project_id, SUM(amount), COUNT(DISTINCT public_key_sender), MAX(timestamp)
+            FROM transactions WHERE type = 'donation'
+            GROUP BY project_id
+        """)
+
+        # Remove totals left for projects without any donation
+        write_query("""
+            DELETE FROM project_totals WHERE project_id NOT IN
+            (SELECT project_id FROM transactions WHERE type = 'donation')
+        """)
     except Exception as e:
-        print(str(e))
-        raise Exception(f"Error updating transactions database: {str(e)}")
+        raise Exception(f"Error rebuilding project totals: {str(e)}")
 
 
-def update_expired_projects_statuses():
+def verify_project_totals():
     """
-    Updates the status of projects based on their expiry date and total donations compared to their goals.
+    Compares the project_totals table with a full aggregate of the transactions table.
+
+    Returns:
+        list: dictionaries with the stored and expected totals of each project that doesn't match (empty when consistent).
+    """
+    query = """
+        SELECT project_id, SUM(stored_total) AS stored_total, SUM(expected_total) AS expected_total,
+        SUM(stored_donors) AS stored_donors, SUM(expected_donors) AS expected_donors
+        FROM (
+            SELECT project_id, total_donated AS stored_total, 0 AS expected_total,
+            donor_count AS stored_donors, 0 AS expected_donors
+            FROM project_totals
+            UNION ALL
+            SELECT project_id, 0, SUM(amount), 0, COUNT(DISTINCT public_key_sender)
+            FROM transactions WHERE type = 'donation' GROUP BY project_id
+        )
+        GROUP BY project_id
+        HAVING SUM(stored_total) != SUM(expected_total) OR SUM(stored_donors) != SUM(expected_donors)
+    """
+    return fetch_query(query)
+
+
+""" IMAGES """
+
+def load_image(image_file):
+    """
+    Decodes and validates an uploaded image.
 
     Params:
-        projects_list (list): list of dictionaries, each containing
-        the details of a project.
+        image_file (file): seekable binary file with the image content.
 
     Returns:
-        bool: True if the status update operation is successful for all projects, False otherwise.
+        Image: the decoded image, upright and in RGB or RGBA mode.
+        Raises ValueError if it isn't an image in one of IMAGE_FORMATS (or is too large).
     """
     try:
+        # Check the file really is an image before decoding it all (verify() leaves the image unusable)
+        with Image.open(image_file) as image:
+            image_format = image.format
+            if image_format not in IMAGE_FORMATS:
+                raise ValueError(f"format {image_format} is not supported")
+            if image.width * image.height > IMAGE_MAX_PIXELS:
+                raise ValueError(f"{image.width}x{image.height} pixels is too large")
+            image.verify()
+
+        image_file.seek(0)
+        image = Image.open(image_file)
+        image.load()
+    except UnidentifiedImageError:
+        raise ValueError("Invalid image: the file isn't a supported image.")
+    except (ValueError, OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Invalid image: {str(e)}.")
+
+    # Apply the camera orientation, and keep transparency only when there is any
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+
+def resize_image(image, width):
+    """
+    Scales an image down to a width, keeping its proportions (smaller images are never enlarged).
 
-        # Fetch active projects
-        projects_list = fetch_query("""
-            SELECT id AS project_id, status, expire_date, goal
-            FROM projects WHERE status = 'active'
-        """)
+    Params:
+        image (Image): the image to resize.
+        width (int): the maximum width.
 
-        # If there isn't any, nothing needs to be done
-        if not projects_list:
-            return True
-        
-        # Calculate total amount of donations per project
-        projects_list = calculate_total_donations(projects_list)
+    Returns:
+        Image: the resized copy.
+    """
+    resized = image.copy()
+    resized.thumbnail((width, width * image.height // image.width or 1), Image.Resampling.LANCZOS)
+    return resized
 
-        for project in projects_list:
 
-            # Parse expiration date to datetime format
-            project["expire_date"] = datetime.strptime(project["expire_date"], "%Y-%m-%d %H:%M:%S")
-
-            if project["expire_date"] < datetime.today():
-
-                # Donations are refunded when project doesn't meet the goal
-                new_status = "refund"
-                
-                # Projects that achieved their goal will be funded by admin
-                if project["total_donations"] >= project["goal"]:
-                    new_status = "fund"
-
-                # Projects without donations pass directly to unsuccessful
-                if project["total_donations"] == 0:
-                    new_status = "unsuccessful"
-                
-                # Updates the project status
-                query = "UPDATE projects SET status = ? WHERE id = ?"
-                params = (new_status, project["project_id"])
-                write_query(query, params)
-        
-        return True
-    except Exception as e:
-        print(f"Error changing status: {str(e)}")
-        return False
+def image_variant_path(file_path, variant, extension):
+    """
+    Builds the path of a resized variant stored next to an image: 'x.png' -> 'x_thumb.webp'.
+
+    Params:
+        file_path (str): the image path.
+        variant (str): a name from IMAGE_VARIANTS.
+        extension (str): 'webp' or 'png'.
+
+    Returns:
+        str: the variant path.
+    """
+    return f"{os.path.splitext(file_path)[0]}_{variant}.{extension}"
+
+
+def save_image_file(image, file_path, image_format, **params):
+    """
+    Saves an image through a temporary file renamed into place, so a file is never seen half written
+    (by a browser, or by the same image uploaded at the same time).
+
+    Params:
+        image (Image): the image to save.
+        file_path (str): the final path.
+        image_format (str): Pillow format name ('PNG', 'WEBP').
+        **params: extra options for Image.save.
+    """
+    temp_path = f"{file_path}.{secrets.token_hex(4)}.tmp"
+    try:
+        image.save(temp_path, image_format, **params)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def save_image_variants(image, file_path):
+    """
+    Saves the resized variants of an image (see IMAGE_VARIANTS), each one as WebP and as a PNG fallback.
+
+    Params:
+        image (Image): the decoded image.
+        file_path (str): the path of the image on disk.
+    """
+    for variant, width in IMAGE_VARIANTS.items():
+        resized = resize_image(image, width)
+        save_image_file(resized, image_variant_path(file_path, variant, "webp"), "WEBP", quality=IMAGE_WEBP_QUALITY)
+        save_image_file(resized, image_variant_path(file_path, variant, "png"), "PNG")
+
+
+def image_sources(image_path):
+    """
+    Builds the URLs to display a project's image: the resized variants when they exist,
+    or just the original image (for images uploaded before variants were generated).
+    Used by the templates.
+
+    Params:
+        image_path (str): the image path stored in the projects table.
+
+    Returns:
+        dict: 'src' (PNG fallback URL), and 'webp_srcset' and 'png_srcset' (empty without variants).
+    """
+    # Paths may have been stored with Windows separators
+    path = image_path.replace("\\", "/")
+    sources = {"src": "/" + path, "webp_srcset": "", "png_srcset": ""}
+
+    if not os.path.exists(os.path.join(base_dir, image_variant_path(path, "thumb", "webp"))):
+        return sources
+
+    for extension in ["webp", "png"]:
+        sources[f"{extension}_srcset"] = ", ".join(
+            f"/{image_variant_path(path, variant, extension)} {width}w" for variant, width in IMAGE_VARIANTS.items()
+        )
+    sources["src"] = "/" + image_variant_path(path, "thumb", "png")
+    return sources
+
+
+def image_digest(image_file):
+    """
+    Hashes an uploaded image in chunks, leaving the file at its start.
+
+    Params:
+        image_file (file): seekable binary file with the image content.
+
+    Returns:
+        str: the SHA-256 of the content in hex.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_addressed_image(path):
+    """
+    Checks if a path points to an image stored under its content hash (or to one of its variants),
+    whose content never changes and can be cached for good.
+
+    Params:
+        path (str): file path or URL.
+
+    Returns:
+        bool: True for content-addressed project images.
+    """
+    return re.fullmatch(r"[0-9a-f]{64}(_[a-z]+)?\.(png|webp)", os.path.basename(path)) is not None
+
+
+def store_image(image_file):
+    """
+    Validates an uploaded image and saves it to the images directory as PNG (scaled down to IMAGE_MAX_SIDE),
+    together with its resized variants. Images are named after the hash of their content,
+    so the same image uploaded again (by another project, or on a retry) reuses the stored files.
+
+    Params:
+        image_file (file): seekable binary file with the image content.
+
+    Returns:
+        str: the file URL of the stored image.
+        Raises ValueError if the image is invalid.
+    """
+    filename = image_digest(image_file) + ".png"
+
+    # Get directory path from config.py
+    upload_dir = IMAGE_UPLOAD_DIR
+    file_path = os.path.join(upload_dir, filename)
+
+    # Already stored: keep every file of the image safe from gc-images (a missing file is generated again below)
+    stored_files = [file_path] + [
+        image_variant_path(file_path, variant, extension) for variant in IMAGE_VARIANTS for extension in ["webp", "png"]
+    ]
+    if all(os.path.exists(stored_file) for stored_file in stored_files):
+        for stored_file in stored_files:
+            os.utime(stored_file)
+        return os.path.join('static', 'images', 'projects', filename)
+
+    image = load_image(image_file)
+
+    # Save the variants and then the image (never larger than needed)
+    image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+    save_image_variants(image, file_path)
+    save_image_file(image, file_path, "PNG")
+
+    return os.path.join('static', 'images', 'projects', filename)
+
+
+def upload_image_file(image_file):
+    """
+    Uploads an image sent as a multipart file. Werkzeug streams large files to a temporary file in chunks
+    while parsing the request, so the image is read from disk and never held in memory as a whole.
+
+    Params:
+        image_file (FileStorage): the uploaded file (request.files).
+
+    Returns:
+        str: the file URL of the uploaded image.
+        Raises ValueError if the image is invalid or larger than IMAGE_MAX_UPLOAD_SIZE.
+    """
+    stream = image_file.stream
+
+    # Check the size without reading the file
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    if size > IMAGE_MAX_UPLOAD_SIZE:
+        raise ValueError(f"Invalid image: files larger than {IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024)}MB are not allowed.")
+
+    return store_image(stream)
 
 
 def upload_image(base64_img, app):
     """
     Uploads an image to the server by decoding the provided Base64 image string and saving it to a predefined directory.
+    Kept for clients that still send the image as a base64 form field (see upload_image_file).
 
     Params:
         base64_img (str): the Base64-encoded image string to be decoded and saved.
@@ -709,30 +1948,312 @@ def upload_image(base64_img, app):
 
     Returns:
         str: the file URL of the uploaded image.
+        Raises ValueError if the image is invalid.
     """
 
     try:
         # Decode to bytes avoiding padding error
         image_str = base64_img.split(",")[1]
         image_bytes = base64.b64decode(image_str + "==")
+    except Exception as e:
+        raise ValueError(f"Invalid image: {str(e)}.")
+
+    if len(image_bytes) > IMAGE_MAX_UPLOAD_SIZE:
+        raise ValueError(f"Invalid image: files larger than {IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024)}MB are not allowed.")
+
+    return store_image(io.BytesIO(image_bytes))
+
 
-        # Generate a secure filename
-        random_hex = secrets.token_hex(8)
-        filename = random_hex + ".png"
+def backfill_image_variants():
+    """
+    Generates the resized variants of the projects' images uploaded before they existed.
+
+    Returns:
+        tuple: number of images processed and list of image paths that couldn't be processed.
+    """
+    processed = 0
+    failed = []
+
+    for project in fetch_query("SELECT DISTINCT image_path FROM projects", cache=False):
+        file_path = os.path.join(base_dir, project["image_path"].replace("\\", "/"))
+        if os.path.exists(image_variant_path(file_path, "thumb", "webp")):
+            continue
+
+        try:
+            with open(file_path, "rb") as f:
+                image = load_image(f)
+            save_image_variants(image, file_path)
+            processed += 1
+        except (ValueError, OSError) as e:
+            print(f"Error processing {project['image_path']}: {str(e)}")
+            failed.append(project["image_path"])
+
+    return processed, failed
+
+
+def image_reference_counts():
+    """
+    Counts how many projects use each stored image.
+
+    Returns:
+        dict: image file name -> number of projects referencing it.
+    """
+    rows = fetch_query("SELECT image_path, COUNT(*) AS refs FROM projects GROUP BY image_path", cache=False)
+
+    references = {}
+    for row in rows:
+        filename = os.path.basename(row["image_path"].replace("\\", "/"))
+        references[filename] = references.get(filename, 0) + row["refs"]
+    return references
+
+
+def collect_image_garbage(dry_run=False):
+    """
+    Deletes the files in the images directory no project references anymore (images and their variants).
+    An image and its variants are kept or deleted together: all of them are kept if any was changed
+    in the last IMAGE_GC_GRACE_PERIOD seconds, since a project may be being created with the image.
 
-        # Get directory path from config.py
-        upload_dir = IMAGE_UPLOAD_DIR
+    Params:
+        dry_run (bool, optional): only list the files that would be deleted.
+
+    Returns:
+        list: paths of the orphaned files (deleted unless dry_run).
+    """
+    references = image_reference_counts()
+    referenced_stems = {os.path.splitext(filename)[0] for filename, refs in references.items() if refs > 0}
+    variant_suffix = re.compile(rf"_({'|'.join(IMAGE_VARIANTS)})$")
+    upload_dir = os.path.join(base_dir, IMAGE_UPLOAD_DIR)
+    cutoff = time.time() - IMAGE_GC_GRACE_PERIOD
+    orphans = []
+
+    # Group each image with its variants
+    stems = {}
+    for filename in sorted(os.listdir(upload_dir)):
         file_path = os.path.join(upload_dir, filename)
+        if os.path.isfile(file_path):
+            stems.setdefault(variant_suffix.sub("", os.path.splitext(filename)[0]), []).append(file_path)
 
-        with open(file_path, 'wb') as f:
-            f.write(image_bytes)
+    for stem, file_paths in stems.items():
+        if stem in referenced_stems or max(os.path.getmtime(file_path) for file_path in file_paths) > cutoff:
+            continue
 
-        file_url = os.path.join('static', 'images', 'projects', filename)
+        orphans.extend(file_paths)
+        if not dry_run:
+            for file_path in file_paths:
+                os.remove(file_path)
 
-        return file_url
-    except Exception as e:
-        print("Error uploading image:", e)
-        return e
+    return orphans
+
+
+""" HTTP CACHING """
+
+# Fingerprints of static files: filename -> (modification time, fingerprint)
+static_fingerprints = {}
+static_fingerprints_lock = threading.Lock()
+
+
+def static_fingerprint(filename):
+    """
+    Returns a short hash of a static file's content, added to its URLs (?v=...) so they change whenever the file does
+    and browsers can cache them for good. Recomputed only when the file is modified.
+
+    Params:
+        filename (str): path of the file inside the static folder.
+
+    Returns:
+        str: the fingerprint, or None if the file doesn't exist.
+    """
+    file_path = os.path.join(base_dir, "static", filename)
+    try:
+        modified_at = os.path.getmtime(file_path)
+    except OSError:
+        return None
+
+    with static_fingerprints_lock:
+        cached = static_fingerprints.get(filename)
+    if cached and cached[0] == modified_at:
+        return cached[1]
+
+    with open(file_path, "rb") as f:
+        fingerprint = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    with static_fingerprints_lock:
+        static_fingerprints[filename] = (modified_at, fingerprint)
+    return fingerprint
+
+
+def compute_build_fingerprint():
+    """
+    Hashes the code, templates and static files rendering the pages, so a deploy changes every page's ETag.
+
+    Returns:
+        str: the fingerprint.
+    """
+    file_paths = [os.path.join(base_dir, filename) for filename in os.listdir(base_dir) if filename.endswith(".py")]
+
+    for folder, extensions in [("templates", (".html",)), ("static", (".css", ".js"))]:
+        for root, dirs, files in os.walk(os.path.join(base_dir, folder)):
+            dirs[:] = [d for d in dirs if d != "images"]
+            file_paths += [os.path.join(root, filename) for filename in files if filename.endswith(extensions)]
+
+    digest = hashlib.sha256()
+    for file_path in sorted(file_paths):
+        with open(file_path, "rb") as f:
+            digest.update(os.path.relpath(file_path, base_dir).encode() + f.read())
+
+    return digest.hexdigest()[:16]
+
+
+build_fingerprint = compute_build_fingerprint()
+
+
+def project_version(project_id):
+    """
+    Reads a project's change counter (bumped by triggers on every change of the project or its transactions).
+
+    Params:
+        project_id (int): the project ID.
+
+    Returns:
+        dict: 'version' and 'updated_at' (UTC), or None for unknown projects.
+    """
+    rows = fetch_query("SELECT version, updated_at FROM project_versions WHERE project_id = ?", (project_id,), cache=False)
+    return rows[0] if rows else None
+
+
+def projects_version():
+    """
+    Reads a change counter of all projects, for pages listing them: the sum of every project's version
+    grows with any change, and the count with any new project.
+
+    Returns:
+        dict: 'version' and 'updated_at' (UTC of the latest change).
+    """
+    query = """
+        SELECT COUNT(*) || '.' || IFNULL(SUM(version), 0) AS version, MAX(updated_at) AS updated_at
+        FROM project_versions
+    """
+    return fetch_query(query, cache=False)[0]
+
+
+def conditional_page(version_function):
+    """
+    A decorator for Flask routes showing projects: GET responses get an ETag built from the projects' change counter
+    (plus the connected wallet, the day, for days left, and the build), and requests already holding that ETag
+    are answered 304 Not Modified without rendering the page.
+    Projects changed in the last QUERY_CACHE_TTL seconds get no ETag, since other worker processes
+    may still render them from their query caches.
+
+    Params:
+        version_function (function): receives the route's arguments and returns project_version-like dicts (or None).
+
+    Returns:
+        function: the decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != "GET":
+                return f(*args, **kwargs)
+
+            version = version_function(**kwargs)
+            if version is None or version["updated_at"] is None:
+                return f(*args, **kwargs)
+
+            updated_at = datetime.strptime(version["updated_at"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            if QUERY_CACHE_ENABLED and updated_at > datetime.now(timezone.utc) - timedelta(seconds=QUERY_CACHE_TTL):
+                return f(*args, **kwargs)
+
+            # Same wallet, same day and same code render the same page for the same version
+            validator = f"{build_fingerprint}:{version['version']}:{session.get('public_key')}:{datetime.today().date()}"
+            etag = hashlib.sha256(validator.encode()).hexdigest()[:32]
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = updated_at
+            return response
+        return decorated_function
+    return decorator
+
+
+def cache_control(response):
+    """
+    Sets the caching policy of a response:
+    static files with a fingerprinted or content-addressed URL are cached for good, other static files are revalidated,
+    pages with an ETag (conditional_page) are kept only by the user's browser and revalidated,
+    and everything else (session-dependent pages, API calls) is never stored.
+
+    Params:
+        response (Response): the response to a request.
+
+    Returns:
+        Response: the same response.
+    """
+    if request.endpoint == "static":
+        filename = request.view_args.get("filename", "")
+        fingerprint = request.args.get("v")
+        if is_content_addressed_image(filename) or (fingerprint and fingerprint == static_fingerprint(filename)):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_CACHE_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    if response.headers.get("ETag"):
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    response.headers["Expires"] = 0
+    response.headers["Pragma"] = "no-cache"
+    return response
+
+
+""" FRAGMENTS """
+
+def project_cards(projects_list):
+    """
+    Renders the cards of a projects list, reusing the cards already rendered (see db.fragment_cache_get_many).
+    A card only changes with its project's version (status, details, totals), whether the connected wallet owns it,
+    its days left and the templates, so these make up its cache key. Used by the templates.
+
+    Params:
+        projects_list (list): project dictionaries from search_projects (with their version).
+
+    Returns:
+        list: the HTML of each project's card, in the same order.
+    """
+    public_key = session.get("public_key")
+    keys = [
+        f"card:{build_fingerprint}:{project['project_id']}:{project['version']}:"
+        f"{int(project['public_key'] == public_key)}:{project['days_left']}"
+        for project in projects_list
+    ]
+
+    cards = fragment_cache_get_many(keys)
+
+    # Render the missing cards (a project listed twice is rendered once) with the project_card macro,
+    # so the template context is built once and not for every card
+    rendered = {}
+    missing = [(key, project) for key, project in zip(keys, projects_list) if key not in cards]
+    if missing:
+        context = {}
+        current_app.update_template_context(context)
+        project_card = current_app.jinja_env.get_template("includes/project_card.html").make_module(context).project_card
+
+        for key, project in missing:
+            if key not in rendered:
+                rendered[key] = str(project_card(project))
+
+    fragment_cache_set_many(rendered)
+    cards.update(rendered)
+
+    return [Markup(cards[key]) for key in keys]
 
 
 """ OTHER """
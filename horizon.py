@@ -0,0 +1,331 @@
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from config import (ACCOUNT_CACHE_TTL, DEFAULT_BASE_FEE, FEE_STATS_TTL, FEE_STRATEGIES, HORIZON_MAX_WORKERS,
+                    MISSING_ACCOUNT_CACHE_TTL, horizon_server)
+from datetime import datetime
+from db import db_connection
+from stellar_sdk import Account, Network, TransactionEnvelope
+from stellar_sdk.exceptions import NotFoundError
+
+admin_account = os.environ.get('ADMIN_ACCOUNT')
+
+
+""" ACCOUNTS """
+
+# Known accounts: account id -> (expires_at, exists). Missing accounts are kept for a shorter time
+_account_cache = {}
+
+_account_lock = threading.Lock()
+
+
+def cached_account_exists(account_id):
+    """
+    Looks up an account in the existence cache without asking Horizon.
+
+    Params:
+        account_id (str): the account's public key.
+
+    Returns:
+        bool: True or False if the answer is cached, None otherwise.
+    """
+    with _account_lock:
+        cached = _account_cache.get(account_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def account_exists(account_id):
+    """
+    Checks if an account exists on the Stellar network, asking Horizon only when the answer isn't cached.
+
+    Params:
+        account_id (str): the account's public key.
+
+    Returns:
+        bool: True if the account exists, False otherwise.
+    """
+    cached = cached_account_exists(account_id)
+    if cached is not None:
+        return cached
+
+    try:
+        account = horizon_server.load_account(account_id)
+        exists = True
+        remember_sequence(account_id, account.sequence)
+    except NotFoundError:
+        exists = False
+
+    # Existing accounts are cached much longer than missing ones (which may be created any moment)
+    ttl = ACCOUNT_CACHE_TTL if exists else MISSING_ACCOUNT_CACHE_TTL
+    with _account_lock:
+        _account_cache[account_id] = (time.monotonic() + ttl, exists)
+    return exists
+
+
+def find_missing_accounts(account_ids):
+    """
+    Checks many destination accounts at once: uncached accounts are looked up concurrently
+    (at most HORIZON_MAX_WORKERS Horizon requests in flight), so the time doesn't grow with one round trip per account.
+
+    Params:
+        account_ids (list): public keys of the destination accounts.
+
+    Returns:
+        list: one message per account that doesn't exist or couldn't be checked (empty if all exist).
+    """
+    problems = []
+    unknown_accounts = []
+
+    # Answer cached accounts right away (each account is checked once even if repeated)
+    for account_id in dict.fromkeys(account_ids):
+        exists = cached_account_exists(account_id)
+        if exists is None:
+            unknown_accounts.append(account_id)
+        elif not exists:
+            problems.append(f"{account_id}: account doesn't exist.")
+
+    if not unknown_accounts:
+        return problems
+
+    # Collect every result instead of stopping at the first missing account
+    with ThreadPoolExecutor(max_workers=min(HORIZON_MAX_WORKERS, len(unknown_accounts))) as executor:
+        results = zip(unknown_accounts, [executor.submit(account_exists, account_id) for account_id in unknown_accounts])
+
+        for account_id, future in results:
+            try:
+                if not future.result():
+                    problems.append(f"{account_id}: account doesn't exist.")
+            except Exception as e:
+                problems.append(f"{account_id}: couldn't be checked ({str(e)}).")
+
+    return problems
+
+
+def load_source_account(account_id):
+    """
+    Loads the source account of a new transaction.
+    The admin account's sequence number is tracked in the database (this app is the one submitting its transactions,
+    from any worker process), so Horizon is only asked the first time or after a submission failed with tx_bad_seq.
+    Users' accounts are also used by their wallets outside this app, so they are always loaded from Horizon.
+
+    Params:
+        account_id (str): the account's public key.
+
+    Returns:
+        Account: the account with the sequence number the next transaction must follow.
+    """
+    if account_id == admin_account:
+        with db_connection() as conn:
+            row = conn.execute("SELECT sequence FROM account_sequences WHERE account_id = ?", (account_id,)).fetchone()
+        if row is not None:
+            return Account(account_id, row["sequence"])
+
+    account = horizon_server.load_account(account_id)
+    remember_sequence(account_id, account.sequence)
+
+    with _account_lock:
+        _account_cache[account_id] = (time.monotonic() + ACCOUNT_CACHE_TTL, True)
+    return account
+
+
+def remember_sequence(account_id, sequence):
+    """
+    Stores the latest sequence number known for the admin account (never moving it backwards).
+    Other accounts are also used outside this app, so their sequence numbers aren't tracked.
+
+    Params:
+        account_id (str): the account's public key.
+        sequence (int): sequence number known to be on the ledger.
+    """
+    if account_id != admin_account:
+        return
+
+    query = """
+        INSERT INTO account_sequences (account_id, sequence, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (account_id) DO UPDATE SET sequence = excluded.sequence, updated_at = excluded.updated_at
+        WHERE excluded.sequence > sequence
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute(query, (account_id, sequence, datetime.now()))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error storing sequence number: {str(e)}")
+
+
+def forget_sequence(account_id):
+    """
+    Drops the tracked sequence number, so the next transaction (built by any worker process)
+    reloads the account from Horizon.
+
+    Params:
+        account_id (str): the account's public key.
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute("DELETE FROM account_sequences WHERE account_id = ?", (account_id,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error forgetting sequence number: {str(e)}")
+
+
+def transaction_hash(transaction_xdr):
+    """
+    Computes the hash of a transaction envelope (the same before and after it's signed).
+
+    Params:
+        transaction_xdr (str): the transaction envelope in XDR format.
+
+    Returns:
+        str: the transaction hash in hex, as reported by Horizon.
+    """
+    return TransactionEnvelope.from_xdr(transaction_xdr, Network.TESTNET_NETWORK_PASSPHRASE).hash_hex()
+
+
+def record_submission_result(transaction_xdr, successful, result_codes=None):
+    """
+    Updates the sequence tracking after a transaction is submitted:
+    a successful transaction moves the source's sequence forward, a tx_bad_seq failure forces a resync.
+
+    Params:
+        transaction_xdr (str): the submitted transaction envelope in XDR format.
+        successful (bool): whether Horizon accepted the transaction.
+        result_codes (dict, optional): result_codes from Horizon's error response.
+    """
+    try:
+        envelope = TransactionEnvelope.from_xdr(transaction_xdr, Network.TESTNET_NETWORK_PASSPHRASE)
+        transaction = envelope.transaction
+        source_account_id = transaction.source.account_id
+    except Exception as e:
+        print(f"Error reading submitted transaction: {str(e)}")
+        return
+
+    if successful:
+        remember_sequence(source_account_id, transaction.sequence)
+    elif result_codes and result_codes.get("transaction") == "tx_bad_seq":
+        forget_sequence(source_account_id)
+
+
+""" FEES """
+
+# Latest Horizon fee_stats response, refreshed in the background every FEE_STATS_TTL seconds
+_fee_stats = None
+_fee_refresher_pid = None
+_fee_lock = threading.Lock()
+
+
+def refresh_fee_stats():
+    """
+    Fetches the current fee statistics from Horizon and stores them for get_fee.
+
+    Returns:
+        None
+    """
+    global _fee_stats
+
+    try:
+        fee_stats = horizon_server.fee_stats().call()
+        with _fee_lock:
+            _fee_stats = fee_stats
+    except Exception as e:
+        print(f"Error fetching fee stats: {str(e)}")
+
+
+def _refresh_fee_stats_forever():
+    """
+    Background loop keeping the fee statistics fresh.
+    """
+    while True:
+        refresh_fee_stats()
+        time.sleep(FEE_STATS_TTL)
+
+
+def start_fee_refresher():
+    """
+    Starts the background fee statistics refresher once per worker process.
+
+    Returns:
+        None
+    """
+    global _fee_refresher_pid
+
+    with _fee_lock:
+        if _fee_refresher_pid == os.getpid():
+            return
+        _fee_refresher_pid = os.getpid()
+
+    threading.Thread(target=_refresh_fee_stats_forever, name="fee-stats-refresher", daemon=True).start()
+
+
+def get_fee(operation_type):
+    """
+    Returns the fee per operation for a new transaction, following the strategy configured for the operation type
+    ('base' for the network base fee, or a percentile of recently charged fees such as 'p50' or 'p90').
+    It never waits for Horizon: until the first fee statistics arrive, DEFAULT_BASE_FEE is used.
+
+    Params:
+        operation_type (str): 'donation', 'fund' or 'refund'.
+
+    Returns:
+        int: fee per operation in stroops.
+    """
+    start_fee_refresher()
+
+    with _fee_lock:
+        fee_stats = _fee_stats
+
+    if not fee_stats:
+        return DEFAULT_BASE_FEE
+
+    try:
+        base_fee = int(fee_stats["last_ledger_base_fee"])
+        strategy = FEE_STRATEGIES.get(operation_type, "base")
+
+        if strategy == "base":
+            return base_fee
+
+        # Never offer less than the network base fee
+        return max(base_fee, int(fee_stats["fee_charged"][strategy]))
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error reading fee stats: {str(e)}")
+        return DEFAULT_BASE_FEE
+
+
+""" PAYMENTS """
+
+def fetch_payments(account_id, cursor=None, limit=200):
+    """
+    Fetches one page of an account's payments (sent and received), oldest first.
+
+    Params:
+        account_id (str): the account's public key.
+        cursor (str, optional): paging_token of the last payment already processed (None starts from the first one).
+        limit (int, optional): maximum number of records.
+
+    Returns:
+        list: payment records, as returned by Horizon.
+    """
+    call_builder = horizon_server.payments().for_account(account_id).order(desc=False).limit(limit)
+    if cursor:
+        call_builder = call_builder.cursor(cursor)
+    return call_builder.call()["_embedded"]["records"]
+
+
+def stream_payments(account_id, cursor):
+    """
+    Follows an account's new payments as Horizon streams them (server-sent events).
+
+    Params:
+        account_id (str): the account's public key.
+        cursor (str): paging_token of the last payment already processed ('now' for only new payments).
+
+    Returns:
+        generator: payment records, as they happen.
+    """
+    return horizon_server.payments().for_account(account_id).cursor(cursor).stream()
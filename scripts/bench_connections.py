@@ -0,0 +1,48 @@
+"""
+Benchmark of the request-scoped connection pool: time per request and SQLite connections opened per request
+for the pages reading the most queries, through the Flask test client.
+Once the pool is warm, requests should open no new connection.
+
+Usage: python scripts/bench_connections.py [--requests 300]
+"""
+import argparse
+import contextlib
+import io
+import sqlite3
+
+from benchmark import best_of, use_database_copy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="requests timed per page")
+    args = parser.parse_args()
+
+    use_database_copy()
+
+    # Count every connection opened from now on
+    connects = {"count": 0}
+    connect = sqlite3.connect
+
+    def counting_connect(*params, **kwargs):
+        connects["count"] += 1
+        return connect(*params, **kwargs)
+
+    sqlite3.connect = counting_connect
+
+    import app
+    client = app.app.test_client()
+
+    for path in ("/", "/projects"):
+        # The app logs each request's timing, which would only slow the benchmark down
+        with contextlib.redirect_stdout(io.StringIO()):
+
+            # Warm up the pool (and start the background threads) before timing
+            status = client.get(path).status_code
+            connects["count"] = 0
+            ms_per_request = best_of(lambda: client.get(path), repeat=1, number=args.requests)
+        print(f"{path:10} {ms_per_request:6.2f} ms/req  {connects['count'] / args.requests:.2f} connects/req  (HTTP {status})")
+
+
+if __name__ == "__main__":
+    main()
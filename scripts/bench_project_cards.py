@@ -0,0 +1,72 @@
+"""
+Benchmark of the rendered project cards cache: rendering includes/project_cards.html for a long synthetic listing
+(copies of the repository's projects) without the cache, with a cold and a warm cache, after some projects changed,
+and from the shared file only (a new worker process, with FRAGMENT_CACHE_SHARED=1).
+
+Usage: python scripts/bench_project_cards.py [--projects 5000]
+"""
+import argparse
+import contextlib
+import io
+import os
+
+from benchmark import best_of, use_database_copy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--projects", type=int, default=5000, help="cards in the listing")
+    args = parser.parse_args()
+
+    database_path = use_database_copy()
+
+    import app
+    import db
+    import helpers
+
+    from flask import render_template
+
+    # The shared tier lives next to the database copy
+    db.FRAGMENT_CACHE_SHARED = True
+    db.fragment_cache_path = os.path.join(os.path.dirname(database_path), "fragments.db")
+
+    with app.app.test_request_context("/"), contextlib.redirect_stdout(io.StringIO()):
+        repository_projects = helpers.search_projects()
+        projects = [
+            dict(repository_projects[i % len(repository_projects)], project_id=100000 + i, version=1)
+            for i in range(args.projects)
+        ]
+
+        def render(projects_list=projects):
+            return render_template("includes/project_cards.html", projects_list=projects_list)
+
+        def forget_cards():
+            db._fragment_cache.clear()
+            db._fragment_db_connection().execute("DELETE FROM fragments")
+
+        # Without the cache (every card is rendered), as before the fragment cache
+        get_many, set_many = helpers.fragment_cache_get_many, helpers.fragment_cache_set_many
+        helpers.fragment_cache_get_many, helpers.fragment_cache_set_many = lambda keys: {}, lambda fragments: None
+        uncached = best_of(render)
+        helpers.fragment_cache_get_many, helpers.fragment_cache_set_many = get_many, set_many
+
+        timings = [("No cache", uncached)]
+        timings.append(("Cold cache", best_of(lambda: (forget_cards(), render()))))
+        timings.append(("Warm process cache", best_of(render)))
+
+        # Some projects changed (their version moved on), the rest of the listing is reused
+        for project in projects[:50]:
+            project["version"] += 1
+        timings.append(("50 changed projects", best_of(render, repeat=1)))
+
+        # A new worker process has an empty process cache, but finds the cards in the shared file
+        timings.append(("Shared file only", best_of(lambda: (db._fragment_cache.clear(), render()))))
+        timings.append(("12-card page, warm", best_of(lambda: render(projects[:12]), number=100)))
+
+    for name, milliseconds in timings:
+        print(f"{name:20} {milliseconds:8.2f} ms")
+    print(f"({args.projects} cards, best of 3)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the project name search: the old LIKE '%term%' scan against the FTS5 index used by search_projects,
+on a new database filled with synthetic projects (3 name words and 40 description words each).
+
+Usage: python scripts/bench_search.py [--projects 100000]
+"""
+import argparse
+import random
+
+from benchmark import best_of, use_database_copy
+
+# Words are made of these syllables, so short prefixes match many projects and full words only a few
+SYLLABLES = ["ka", "lo", "mi", "tra", "ven", "sol", "qui", "dor", "pe", "nu", "ar", "zen", "bo", "li", "sta", "ri"]
+
+# Search before the FTS index: every project's name is scanned
+LIKE_QUERY = """
+    SELECT p.id FROM projects p WHERE p.name LIKE ?
+    ORDER BY p.created_at DESC, p.id DESC {limit}
+"""
+
+
+def fill_projects(count):
+    """
+    Inserts synthetic projects (the FTS index is kept in sync by its triggers).
+
+    Returns:
+        list: the words used in names and descriptions.
+    """
+    import config
+
+    random.seed(1)
+    words = sorted({"".join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))) for _ in range(30000)})
+    projects = [
+        ("GBENCHMARK", " ".join(random.choices(words, k=3)), "books", f"2024-01-01 00:00:00.{i:06d}", "active", 100,
+         "2030-01-01 23:59:59", "benchmark.png", " ".join(random.choices(words, k=40)))
+        for i in range(count)
+    ]
+
+    conn = config.get_db_connection()
+    conn.executemany("""
+        INSERT INTO projects (public_key, name, category, created_at, status, goal, expire_date, image_path, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, projects)
+    conn.commit()
+    conn.close()
+    return words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--projects", type=int, default=100000, help="synthetic projects inserted")
+    args = parser.parse_args()
+
+    use_database_copy(empty=True)
+    words = fill_projects(args.projects)
+
+    import config
+    import helpers
+
+    conn = config.get_db_connection()
+    full_word = words[777]
+    prefix = words[1234][:4]
+
+    def like(term, limit=""):
+        return conn.execute(LIKE_QUERY.format(limit=limit), (f"%{term}%",)).fetchall()
+
+    def search(term):
+        return helpers.search_projects(name=term, limit=13, cache=False)
+
+    print(f"{args.projects} projects, full word '{full_word}', prefix '{prefix}'")
+    print(f"LIKE, whole table                    {best_of(lambda: like(full_word)):7.2f} ms  ({len(like(full_word))} matches)")
+    print(f"LIKE, first 13                       {best_of(lambda: like(full_word, 'LIMIT 13')):7.2f} ms")
+    print(f"search_projects, full word, top 13   {best_of(lambda: search(full_word)):7.2f} ms")
+    print(f"search_projects, prefix, top 13      {best_of(lambda: search(prefix)):7.2f} ms  "
+          f"({len(like(prefix))} names match, descriptions too)")
+
+
+if __name__ == "__main__":
+    main()
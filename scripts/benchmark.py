@@ -0,0 +1,59 @@
+"""
+Shared setup of the benchmark scripts (scripts/bench_*.py), run from anywhere, e.g. `python scripts/bench_connections.py`.
+They never touch database/crowdfunding.db: every run works on a migrated temporary copy, or on a new database.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Benchmarks import the app's modules from the repository root (static files are also read relative to it)
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import config
+
+
+def use_database_copy(empty=False):
+    """
+    Points the app at a temporary copy of database/crowdfunding.db (or at a new database) and migrates it.
+    Must be called before importing app, which runs the migrations when imported.
+
+    Params:
+        empty (bool, optional): True to start from a new database instead of the repository's data.
+
+    Returns:
+        str: path of the temporary database.
+    """
+    database_path = os.path.join(tempfile.mkdtemp(prefix="lux-benchmark-"), "crowdfunding.db")
+    if not empty:
+        shutil.copy(config.database_path, database_path)
+    config.database_path = database_path
+
+    import db
+    db.run_migrations()
+    return database_path
+
+
+def best_of(function, repeat=3, number=1):
+    """
+    Times a function, keeping the fastest of several rounds.
+
+    Params:
+        function (function): called without arguments.
+        repeat (int, optional): number of rounds.
+        number (int, optional): calls per round.
+
+    Returns:
+        float: milliseconds per call in the fastest round.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number * 1000)
+    return min(timings)
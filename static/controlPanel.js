@@ -157,11 +157,14 @@ function processAdminTransaction(responseProjects, operationType) {
             let response = await fetch("/build_admin_transaction", requestOptions);
             let data = await response.json();
 
-            // Get transaction XDR for admin to sign
-            let transactionXdr = data.transaction_xdr
+            // Get transactions XDR for admin to sign (batches over 100 operations are split into several transactions)
+            let transactionsXdr = data.transactions_xdr
 
-            // Sign transaction using Freighter extension
-            let signedTransaction = await signingTransaction(transactionXdr);
+            // Sign each transaction using Freighter extension, keeping their order
+            let signedTransactions = [];
+            for (let transactionXdr of transactionsXdr) {
+                signedTransactions.push(await signingTransaction(transactionXdr));
+            }
             
             let modalTitle = document.getElementById("modalTitle")
             let modalBody = document.getElementById("modalBody")
@@ -173,8 +176,8 @@ function processAdminTransaction(responseProjects, operationType) {
             // Block closing modal options
             setModalLockState("lock");
 
-            // Send the signed transaction to Stellar and get hash response
-            let hash = await sendTransaction(signedTransaction);
+            // Send the signed transactions to Stellar and get hash response
+            let hash = await sendTransaction(signedTransactions);
 
             // Update the modal with confirmation and the transaction hash
             modalTitle.innerHTML = "Transaction completed!";
@@ -184,6 +187,11 @@ function processAdminTransaction(responseProjects, operationType) {
             setModalLockState("unlock");
         } catch (error) {
             console.log("Error: ", error);
+
+            // Show the error and allow user to close modal
+            document.getElementById("modalTitle").innerHTML = "Transaction failed";
+            document.getElementById("modalBody").textContent = error.message;
+            setModalLockState("unlock");
         }
     });
 };
\ No newline at end of file
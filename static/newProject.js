@@ -1,7 +1,22 @@
 let imagePreview = document.getElementById('imagePreview');
 let cropper;
 let outputImage = document.getElementById("imageCropped");
-let base64Img= document.getElementById("base64Image");
+let imageInput = document.getElementById("imageInput");
+
+// JPEG qualities tried when encoding the cropped image, until it fits in the upload limit
+const cropQualities = [0.92, 0.8, 0.65, 0.5];
+
+/**
+ * Shows the alert modal with an image error.
+ * @param {string} title - The modal title.
+ * @param {string} body - The explanation shown to the user.
+ */
+function showImageError(title, body) {
+    document.getElementById("modalTitle").innerHTML = title;
+    document.getElementById("modalBody").textContent = body;
+    const modal = new bootstrap.Modal(document.getElementById("alertModal"));
+    modal.show();
+}
 
 /**
  * Shows a preview of the selected image and initializes the cropper tool.
@@ -10,13 +25,13 @@ let base64Img= document.getElementById("base64Image");
  */
 function showImagePreview(imageInput) {
     const file = imageInput.files[0];
+    const maxSize = Number(imageInput.dataset.maxSize);
 
-    // Display an error if the file size exceeds the 900KB
-    if (file.size > 900000) {
-        document.getElementById("modalTitle").innerHTML = "Oops! The image size is too large";
-        document.getElementById("modalBody").textContent = "Please choose an image that is 900KB or smaller.";
-        const modal = new bootstrap.Modal(document.getElementById("alertModal"));
-        modal.show();
+    // Display an error if the file size exceeds the server limit
+    if (file.size > maxSize) {
+        imageInput.value = "";
+        showImageError("Oops! The image size is too large",
+            `Please choose an image that is ${Math.floor(maxSize / (1024 * 1024))}MB or smaller.`);
     } else {
 
         // Destroy current cropper if exists
@@ -36,13 +51,6 @@ function showImagePreview(imageInput) {
             viewMode: 3,
         });
         
-        // Read the file as Data URL to set base64 value
-        const reader = new FileReader();
-        reader.onloadend = function() {
-            base64Img.value = reader.result;
-        }
-        reader.readAsDataURL(file);
-
         // Set and show the cropped image
         outputImage.src = URL.createObjectURL(file);
         outputImage.hidden = false;
@@ -54,11 +62,43 @@ function showImagePreview(imageInput) {
 
 // Crops the selected image and updates the UI with the cropped version
 function cropImage() {
+    const maxSide = Number(imageInput.dataset.maxSide);
+
+    // The server scales images down to maxSide pixels, a larger crop would only make the upload bigger
+    const canvas = cropper.getCroppedCanvas({ maxWidth: maxSide, maxHeight: maxSide });
+    encodeCroppedImage(canvas, 0);
+}
+
+/**
+ * Encodes the cropped area as a JPEG file (a lossless PNG of a photo can be larger than the original)
+ * and puts it in the image input, lowering the quality until it fits in the upload limit.
+ * @param {HTMLCanvasElement} canvas - The cropped area.
+ * @param {number} qualityIndex - Position in cropQualities of the quality to try.
+ */
+function encodeCroppedImage(canvas, qualityIndex) {
+    const maxSize = Number(imageInput.dataset.maxSize);
 
-    // Get the cropped image data URL and lower quality
-    let croppedImage = cropper.getCroppedCanvas().toDataURL("image/jpg", 0.2);
+    canvas.toBlob((blob) => {
 
-    // Update the source and input
-    outputImage.src = croppedImage;
-    base64Img.value = croppedImage;
-}
\ No newline at end of file
+        // Try a lower quality, or keep the selected (uncropped) image if the crop can't fit
+        if (!blob || blob.size > maxSize) {
+            if (blob && qualityIndex + 1 < cropQualities.length) {
+                encodeCroppedImage(canvas, qualityIndex + 1);
+            } else {
+                showImageError("Oops! The cropped image is too large",
+                    `Please choose a smaller image or crop area, the image must be ${Math.floor(maxSize / (1024 * 1024))}MB or smaller.`);
+            }
+            return;
+        }
+
+        // Replace the selected file with the cropped one (sent as multipart data with the form, not as base64 text)
+        const croppedFile = new File([blob], "cropped.jpg", { type: "image/jpeg" });
+        const dataTransfer = new DataTransfer();
+        dataTransfer.items.add(croppedFile);
+        imageInput.files = dataTransfer.files;
+
+        // Update the preview
+        URL.revokeObjectURL(outputImage.src);
+        outputImage.src = URL.createObjectURL(croppedFile);
+    }, "image/jpeg", cropQualities[qualityIndex]);
+}
@@ -83,6 +83,11 @@ async function processDonation() {
         setModalLockState("unlock");
 
     } catch (error) {
-        return console.log("Error: ", error);
+        console.log("Error: ", error);
+
+        // Show the error and allow user to close modal
+        document.getElementById("modalTitle").innerHTML = "Transaction failed";
+        document.getElementById("modalBody").textContent = error.message;
+        setModalLockState("unlock");
     }
 };
\ No newline at end of file
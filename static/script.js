@@ -177,11 +177,13 @@ async function signingTransaction(transactionXdr) {
 
 /**
  * Sends a signed transaction to the server for submission to the Stellar network.
- * The server handles the transaction submission and any related errors, responding 
- * with the transaction hash or an error message.
+ * The server queues the transaction and submits it in the background, so this function
+ * polls the submission status until it responds with the transaction hash or an error message.
  * This function is called by controlPanel.js and project.js.
- * @param {string} signedTransactionXdr - The signed transaction in XDR format.
- * @returns {Promise<string>} - A promise that resolves to the hash of the submitted transaction.
+ * @param {string|string[]} signedTransactionXdr - The signed transaction in XDR format,
+ * or the ordered list of signed transactions of a split batch.
+ * @returns {Promise<string>} - A promise that resolves to the hash (comma separated hashes for a batch) of the submitted transactions.
+ * @throws {Error} If the submission fails.
  */
 async function sendTransaction(signedTransactionXdr) {
 
@@ -193,17 +195,167 @@ async function sendTransaction(signedTransactionXdr) {
         body: JSON.stringify(signedTransactionXdr)
     };
 
-    try {
+    // Send the signed transaction to the server, which answers right away with a submission id
+    let response = await fetch("/send_transaction", requestOptions);
+    if (!response.ok) {
+        throw new Error("The transaction could not be sent.");
+    }
+    let data = await response.json();
 
-        // Send the signed transaction to the server and wait for the response
-        let response = await fetch("/send_transaction", requestOptions);
-        
-        // Return the hash if response is successful
-        if (response.ok) {
+    // Check the submission status until it's finished (the server reports stuck submissions as failed,
+    // the attempts limit only covers a server that stopped answering with a final status)
+    for (let attempt = 0; data.status === "queued" || data.status === "submitting"; attempt++) {
+        if (attempt >= submissionPollMaxAttempts) {
+            throw new Error("Timed out waiting for the transaction to be submitted.");
+        }
+        await new Promise(resolve => setTimeout(resolve, submissionPollInterval));
+
+        response = await fetch(`/api/submissions/${data.submission_id}`);
+        if (!response.ok) {
+            throw new Error("The transaction status could not be checked.");
+        }
+        data = await response.json();
+    }
+
+    // Return the hash if submission is successful
+    if (data.status !== "successful") {
+        throw new Error(data.error);
+    }
+    return data.hash;
+};
+
+// Milliseconds between submission status checks, and the most checks before giving up
+// (longer than the server's SUBMISSION_TIMEOUT, after which it reports the submission as failed)
+const submissionPollInterval = 1000;
+const submissionPollMaxAttempts = 180;
+
+// Suggestions currently listed in the search bar and the pending typeahead request timer
+let searchSuggestions = [];
+let suggestTimer;
+
+
+/**
+ * Fetches suggestions from /api/search/suggest while the user types in the search bar (search.html)
+ * and lists them in the #searchSuggestions datalist.
+ * @param {HTMLInputElement} input - The project's name input of the search bar.
+ */
+function suggestProjects(input) {
+
+    // Wait for a short pause in typing before asking the server
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(async () => {
+        try {
+            let response = await fetch("/api/search/suggest?q=" + encodeURIComponent(input.value));
             let data = await response.json();
-            return data.hash;
+            searchSuggestions = data.suggestions;
+
+            // Rebuild the datalist options (categories are labeled as such)
+            const datalist = document.getElementById("searchSuggestions");
+            datalist.innerHTML = "";
+            searchSuggestions.forEach((suggestion) => {
+                const option = document.createElement("option");
+                option.value = suggestion.name;
+                if (suggestion.type == "category") {
+                    option.label = "Category";
+                }
+                datalist.appendChild(option);
+            });
+        } catch (error) {
+            console.log("Error fetching suggestions: ", error);
+        }
+    }, 150);
+};
+
+
+/**
+ * Applies a category picked from the search bar suggestions to the category filter instead of the name.
+ * @param {HTMLInputElement} input - The project's name input of the search bar.
+ */
+function selectSuggestion(input) {
+    const suggestion = searchSuggestions.find((item) => item.name == input.value && item.type == "category");
+
+    if (suggestion) {
+        const categorySelect = document.getElementById("searchProjectCategory");
+        categorySelect.value = suggestion.name.charAt(0).toUpperCase() + suggestion.name.slice(1);
+        input.value = "";
+    }
+};
+
+/**
+ * Loads the next page of projects from /api/projects and appends it to the list.
+ * The page is requested with the cursor and filters stored on the #projectsListEnd element
+ * (projects_list_end.html), which is removed once the last page is loaded.
+ * This function is called by observeProjectsListEnd.
+ * @param {HTMLElement} listEnd - The element placed after the projects list.
+ */
+async function loadNextProjectsPage(listEnd) {
+
+    // Prevent loading the same page twice while a request is in progress
+    if (listEnd.dataset.loading) {
+        return;
+    }
+    listEnd.dataset.loading = "true";
+
+    const params = new URLSearchParams({
+        cursor: listEnd.dataset.cursor,
+        view: listEnd.dataset.view,
+        name: listEnd.dataset.name,
+        category: listEnd.dataset.category,
+        status: listEnd.dataset.status,
+        mine: listEnd.dataset.mine,
+    });
+
+    try {
+        let response = await fetch("/api/projects?" + params.toString());
+        let data = await response.json();
+
+        // Append the rendered projects to the list (cards or table rows)
+        document.getElementById(listEnd.dataset.target).insertAdjacentHTML("beforeend", data.html);
+
+        // Keep the cursor for the next page or stop when there are no more projects
+        if (data.next_cursor) {
+            listEnd.dataset.cursor = data.next_cursor;
+            delete listEnd.dataset.loading;
+        } else {
+            listEnd.remove();
         }
     } catch (error) {
-        throw error;
+        console.log("Error loading projects: ", error);
+        delete listEnd.dataset.loading;
+    }
+};
+
+
+/**
+ * Watches the end of the projects list (infinite scroll) and loads the next page when it becomes visible.
+ * This function runs on every page, but only acts on pages with a paginated projects list.
+ */
+function observeProjectsListEnd() {
+    const listEnd = document.getElementById("projectsListEnd");
+    if (!listEnd) {
+        return;
     }
-};
\ No newline at end of file
+
+    const observer = new IntersectionObserver(async (entries) => {
+        for (const entry of entries) {
+            if (entry.isIntersecting) {
+                await loadNextProjectsPage(listEnd);
+
+                // Observe again, so an end of list that is still visible loads one more page
+                if (listEnd.isConnected) {
+                    observer.unobserve(listEnd);
+                    observer.observe(listEnd);
+                }
+            }
+        }
+    }, { rootMargin: "400px" });
+
+    observer.observe(listEnd);
+};
+
+// The script is loaded async, so the document may already be parsed
+if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", observeProjectsListEnd);
+} else {
+    observeProjectsListEnd();
+}
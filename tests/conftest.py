@@ -0,0 +1,198 @@
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+from collections import Counter, OrderedDict
+
+import pytest
+
+# Tests import the app's modules from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import config
+import db
+import helpers
+import horizon
+
+from stellar_sdk import Account, Keypair, Network, TransactionEnvelope
+from stellar_sdk.client.response import Response
+from stellar_sdk.exceptions import BadRequestError, ConnectionError, NotFoundError
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Points the app at a migrated copy of database/crowdfunding.db, with an empty connection pool and query cache.
+
+    Returns:
+        str: path of the database copy.
+    """
+    database_path = str(tmp_path / "crowdfunding.db")
+    shutil.copy(config.database_path, database_path)
+    monkeypatch.setattr(config, "database_path", database_path)
+
+    # Connections and cached rows of the previous test belong to another database
+    pool = queue.LifoQueue(maxsize=config.DB_POOL_SIZE)
+    monkeypatch.setattr(db, "_pool", pool)
+    monkeypatch.setattr(db, "_pool_slots", threading.BoundedSemaphore(config.DB_POOL_SIZE))
+    monkeypatch.setattr(db, "_query_cache", OrderedDict())
+
+    db.run_migrations()
+    yield database_path
+
+    while not pool.empty():
+        pool.get_nowait().close()
+
+
+class StubHorizon:
+    """
+    In-process stand-in for the Horizon server: the accounts it knows (with their sequence numbers),
+    the ones whose requests fail and how many times each one was loaded.
+    Every request waits `latency` seconds, like a round trip.
+
+    Submitted transactions are applied when their sequence number follows their source account's
+    (tx_bad_seq otherwise), except those in `timeouts`, which never get an answer.
+    `submitted` lists the hashes of every submission, in order.
+
+    It also replays the admin account's payments: the history already on the ledger (`history`),
+    and the ones that only arrive while a stream is open (`live`), after which the stream
+    is closed by raising `disconnect`.
+    """
+
+    def __init__(self, latency=0.0):
+        self.accounts = {}
+        self.unreachable = set()
+        self.latency = latency
+        self.loaded = Counter()
+        self.timeouts = set()
+        self.submitted = []
+        self.history = []
+        self.live = []
+        self.disconnect = ConnectionError("Stream closed.")
+
+    def create_account(self, sequence=1000):
+        """
+        Adds a new account to the network.
+
+        Returns:
+            str: the account's public key.
+        """
+        account_id = Keypair.random().public_key
+        self.accounts[account_id] = sequence
+        return account_id
+
+    def load_account(self, account_id):
+        self.loaded[account_id] += 1
+        time.sleep(self.latency)
+
+        if account_id in self.unreachable:
+            raise ConnectionError("Read timed out.")
+        if account_id not in self.accounts:
+            raise NotFoundError(Response(404, '{"title": "Resource Missing"}', {}, f"/accounts/{account_id}"))
+        return Account(account_id, self.accounts[account_id])
+
+    def submit_transaction(self, transaction_envelope):
+        envelope = TransactionEnvelope.from_xdr(transaction_envelope, Network.TESTNET_NETWORK_PASSPHRASE)
+        hash = envelope.hash_hex()
+        transaction = envelope.transaction
+        self.submitted.append(hash)
+        time.sleep(self.latency)
+
+        if hash in self.timeouts:
+            raise ConnectionError("Read timed out.")
+
+        source_account_id = transaction.source.account_id
+        if transaction.sequence != self.accounts.get(source_account_id, 0) + 1:
+            body = {"title": "Transaction Failed", "extras": {"result_codes": {"transaction": "tx_bad_seq"}}}
+            raise BadRequestError(Response(400, json.dumps(body), {}, "/transactions"))
+
+        self.accounts[source_account_id] = transaction.sequence
+        return {"successful": True, "hash": hash, "ledger": len(self.submitted)}
+
+    def payments(self):
+        return StubPaymentsCall(self)
+
+
+class StubPaymentsCall:
+    """
+    The payments call builder of StubHorizon, paging by paging_token like Horizon.
+    """
+
+    def __init__(self, horizon):
+        self.horizon = horizon
+        self.paging_token = None
+        self.page_size = 200
+
+    def for_account(self, account_id):
+        return self
+
+    def order(self, desc=False):
+        return self
+
+    def limit(self, limit):
+        self.page_size = limit
+        return self
+
+    def cursor(self, cursor):
+        self.paging_token = cursor
+        return self
+
+    def records(self):
+        if self.paging_token == "now":
+            return []
+        return [payment for payment in self.horizon.history
+                if self.paging_token is None or int(payment["paging_token"]) > int(self.paging_token)]
+
+    def call(self):
+        return {"_embedded": {"records": self.records()[:self.page_size]}}
+
+    def stream(self):
+        yield from self.records()
+
+        # New payments reach the ledger while the stream is open
+        while self.horizon.live:
+            payment = self.horizon.live.pop(0)
+            self.horizon.history.append(payment)
+            yield payment
+        raise self.horizon.disconnect
+
+
+@pytest.fixture
+def horizon_stub(database, monkeypatch):
+    """
+    Replaces Horizon with a StubHorizon holding a new admin account (stub.admin),
+    with empty account caches and no background threads: fees are DEFAULT_BASE_FEE,
+    and queued submission batches wait in an empty queue until the test processes them.
+
+    Returns:
+        StubHorizon: the stand-in used by horizon.py and helpers.py.
+    """
+    stub = StubHorizon()
+    stub.admin = stub.create_account()
+
+    for module in (horizon, helpers):
+        monkeypatch.setattr(module, "horizon_server", stub)
+        monkeypatch.setattr(module, "admin_account", stub.admin)
+    monkeypatch.setattr(horizon, "_account_cache", {})
+    monkeypatch.setattr(horizon, "_fee_refresher_pid", os.getpid())
+    monkeypatch.setattr(helpers, "submission_queue", queue.Queue())
+    monkeypatch.setattr(helpers, "submission_workers_pid", os.getpid())
+    monkeypatch.setattr(helpers, "expiry_scheduler_pid", os.getpid())
+    return stub
+
+
+@pytest.fixture
+def client(horizon_stub, monkeypatch):
+    """
+    Returns a Flask test client of the app, using the stub Horizon and the database copy.
+    """
+    # Imported once the database copy is in place (the app runs the migrations when imported)
+    import app as app_module
+
+    monkeypatch.setattr(app_module.app, "secret_key", "test")
+    monkeypatch.setattr(app_module, "admin_account", horizon_stub.admin)
+    return app_module.app.test_client()
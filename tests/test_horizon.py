@@ -0,0 +1,183 @@
+import multiprocessing
+import time
+
+import pytest
+
+from stellar_sdk import Keypair, Network, TransactionEnvelope
+
+import helpers
+import horizon
+
+# Projects of the database copy waiting to be funded, and still receiving donations
+FUND_PROJECT_ID = 23
+ACTIVE_PROJECT_ID = 13
+
+
+def build_fund(horizon_stub):
+    """
+    Builds an admin transaction funding a project's owner.
+
+    Returns:
+        str: the transaction in XDR format.
+    """
+    owner = horizon_stub.create_account()
+    operations = [{"project_id": FUND_PROJECT_ID, "amount": 10, "destination_account": owner}]
+    return helpers.build_payment_transaction(operations, "fund")[0]
+
+
+def sequence(transaction_xdr):
+    return TransactionEnvelope.from_xdr(transaction_xdr, Network.TESTNET_NETWORK_PASSPHRASE).transaction.sequence
+
+
+""" ACCOUNTS """
+
+def test_existing_accounts_are_cached(horizon_stub):
+    account_id = horizon_stub.create_account()
+
+    assert horizon.account_exists(account_id)
+    assert horizon.account_exists(account_id)
+    assert horizon_stub.loaded[account_id] == 1
+
+
+def test_missing_accounts_are_cached_for_a_short_time(horizon_stub, monkeypatch):
+    account_id = Keypair.random().public_key
+
+    assert not horizon.account_exists(account_id)
+    assert not horizon.account_exists(account_id)
+    assert horizon_stub.loaded[account_id] == 1
+
+    # Once the missing answer expires, an account funded meanwhile is found (and then cached as existing)
+    other_account_id = Keypair.random().public_key
+    monkeypatch.setattr(horizon, "MISSING_ACCOUNT_CACHE_TTL", 0)
+    assert not horizon.account_exists(other_account_id)
+    horizon_stub.accounts[other_account_id] = 1
+    assert horizon.account_exists(other_account_id)
+    assert horizon.account_exists(other_account_id)
+    assert horizon_stub.loaded[other_account_id] == 2
+
+
+""" SEQUENCE NUMBERS """
+
+def test_admin_sequence_is_loaded_once(horizon_stub):
+    first = build_fund(horizon_stub)
+
+    # Built but never submitted transactions don't use up a sequence number
+    assert sequence(build_fund(horizon_stub)) == sequence(first) == 1001
+
+    horizon.record_submission_result(first, True)
+    assert sequence(build_fund(horizon_stub)) == 1002
+    assert horizon_stub.loaded[horizon_stub.admin] == 1
+
+
+def test_bad_sequence_reloads_the_admin_account(horizon_stub):
+    transaction = build_fund(horizon_stub)
+
+    # The admin account was used outside the app, so Horizon rejects the transaction
+    horizon_stub.accounts[horizon_stub.admin] = 1005
+    horizon.record_submission_result(transaction, False, {"transaction": "tx_bad_seq"})
+
+    assert sequence(build_fund(horizon_stub)) == 1006
+    assert horizon_stub.loaded[horizon_stub.admin] == 2
+
+
+def test_other_failures_keep_the_admin_sequence(horizon_stub):
+    transaction = build_fund(horizon_stub)
+    horizon.record_submission_result(transaction, False, {"transaction": "tx_insufficient_fee"})
+
+    assert sequence(build_fund(horizon_stub)) == 1001
+    assert horizon_stub.loaded[horizon_stub.admin] == 1
+
+
+def test_admin_sequence_never_moves_backwards(horizon_stub):
+    horizon.remember_sequence(horizon_stub.admin, 1010)
+    horizon.remember_sequence(horizon_stub.admin, 1003)
+
+    assert sequence(build_fund(horizon_stub)) == 1011
+
+
+def test_admin_sequence_is_shared_between_worker_processes(horizon_stub):
+    transaction = build_fund(horizon_stub)
+
+    # Another worker process submits the transaction built by this one
+    worker = multiprocessing.get_context("fork").Process(
+        target=horizon.record_submission_result, args=(transaction, True)
+    )
+    worker.start()
+    worker.join()
+
+    assert worker.exitcode == 0
+    assert sequence(build_fund(horizon_stub)) == 1002
+    assert horizon_stub.loaded[horizon_stub.admin] == 1
+
+
+def test_donor_accounts_are_always_loaded(horizon_stub):
+    donor = horizon_stub.create_account()
+    operations = [{"project_id": ACTIVE_PROJECT_ID, "amount": 5, "source_account": donor,
+                   "destination_account": horizon_stub.admin}]
+
+    first = helpers.build_payment_transaction(operations, "donation")[0]
+    horizon.record_submission_result(first, True)
+
+    # The donor's wallet may have used the account meanwhile
+    horizon_stub.accounts[donor] = 1007
+    assert sequence(helpers.build_payment_transaction(operations, "donation")[0]) == 1008
+    assert horizon_stub.loaded[donor] == 2
+
+
+""" DESTINATION CHECKS """
+
+def test_every_missing_account_is_reported(horizon_stub):
+    existing = [horizon_stub.create_account() for _ in range(5)]
+    missing = [Keypair.random().public_key for _ in range(3)]
+
+    problems = horizon.find_missing_accounts(existing + missing)
+
+    assert problems == [f"{account_id}: account doesn't exist." for account_id in missing]
+
+
+def test_repeated_accounts_are_checked_once(horizon_stub):
+    donor = horizon_stub.create_account()
+    missing = Keypair.random().public_key
+
+    assert len(horizon.find_missing_accounts([donor, missing, donor, missing])) == 1
+    assert horizon_stub.loaded[donor] == horizon_stub.loaded[missing] == 1
+
+
+def test_lookup_errors_are_reported_per_account(horizon_stub):
+    reachable = horizon_stub.create_account()
+    unreachable = horizon_stub.create_account()
+    horizon_stub.unreachable.add(unreachable)
+
+    problems = horizon.find_missing_accounts([reachable, unreachable])
+
+    assert len(problems) == 1
+    assert problems[0].startswith(f"{unreachable}: couldn't be checked")
+
+
+def test_accounts_are_checked_concurrently(horizon_stub):
+    horizon_stub.latency = 0.05
+    accounts = [horizon_stub.create_account() for _ in range(16)]
+
+    started = time.perf_counter()
+    assert horizon.find_missing_accounts(accounts) == []
+    elapsed = time.perf_counter() - started
+
+    # One by one it would take 16 round trips, HORIZON_MAX_WORKERS requests in flight take a few
+    assert elapsed < len(accounts) * horizon_stub.latency / 2
+
+    # Known accounts are answered from the cache
+    started = time.perf_counter()
+    assert horizon.find_missing_accounts(accounts) == []
+    assert time.perf_counter() - started < horizon_stub.latency
+    assert sum(horizon_stub.loaded[account_id] for account_id in accounts) == len(accounts)
+
+
+def test_refund_lists_every_missing_donor(horizon_stub):
+    donors = [horizon_stub.create_account(), Keypair.random().public_key, Keypair.random().public_key]
+    operations = [{"project_id": FUND_PROJECT_ID, "amount": 3, "destination_account": donor} for donor in donors]
+
+    with pytest.raises(Exception) as error:
+        helpers.build_payment_transaction(operations, "refund")
+
+    assert donors[0] not in str(error.value)
+    assert donors[1] in str(error.value) and donors[2] in str(error.value)
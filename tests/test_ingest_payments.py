@@ -0,0 +1,131 @@
+import pytest
+
+from stellar_sdk import Keypair
+
+import helpers
+
+# Project of the database copy still receiving donations
+ACTIVE_PROJECT_ID = 13
+
+
+class StopFollowing(BaseException):
+    """
+    Ends follow_payments, which otherwise reconnects forever (it only catches Exception).
+    """
+
+
+def build_donation(horizon_stub):
+    """
+    Builds a donation to the admin account from a new donor (the browser never calls /send_transaction for it).
+
+    Returns:
+        str: the transaction hash.
+    """
+    donor = horizon_stub.create_account()
+    operations = [{"project_id": ACTIVE_PROJECT_ID, "amount": 5, "source_account": donor,
+                   "destination_account": horizon_stub.admin}]
+    return helpers.transaction_hash(helpers.build_payment_transaction(operations, "donation")[0])
+
+
+def payment_record(horizon_stub, transaction_hash, paging_token, successful=True, type="payment"):
+    return {"type": type, "transaction_hash": transaction_hash, "transaction_successful": successful,
+            "paging_token": str(paging_token), "to": horizon_stub.admin}
+
+
+def replay_history(horizon_stub, donations):
+    """
+    Fills the stub's payment history with app-built donations, each followed by a payment this app didn't build.
+
+    Returns:
+        list: hashes of the app-built donations.
+    """
+    hashes = []
+    for _ in range(donations):
+        hashes.append(build_donation(horizon_stub))
+        horizon_stub.history.append(payment_record(horizon_stub, hashes[-1], 1000 + len(horizon_stub.history)))
+        horizon_stub.history.append(payment_record(horizon_stub, Keypair.random().public_key, 1000 + len(horizon_stub.history)))
+    return hashes
+
+
+def recorded_transactions(hashes):
+    placeholders = ", ".join("?" * len(hashes))
+    query = f"SELECT COUNT(*) AS count FROM transactions WHERE hash IN ({placeholders})"
+    return helpers.fetch_query(query, tuple(hashes), cache=False)[0]["count"]
+
+
+def pending_operations(hash):
+    query = "SELECT COUNT(*) AS count FROM pending_operations WHERE transaction_hash = ?"
+    return helpers.fetch_query(query, hash, cache=False)[0]["count"]
+
+
+def cursor(horizon_stub):
+    return helpers.get_ingest_cursor(f"payments:{horizon_stub.admin}")
+
+
+def test_sync_resumes_after_a_stop(horizon_stub):
+    hashes = replay_history(horizon_stub, 6)
+    history = horizon_stub.history
+
+    # The ingester stops halfway (only the first half had reached the ledger)
+    horizon_stub.history = history[:6]
+    assert helpers.sync_payments(horizon_stub.admin) == 3
+    assert cursor(horizon_stub) == history[5]["paging_token"]
+
+    horizon_stub.history = history
+    assert helpers.sync_payments(horizon_stub.admin) == 3
+    assert helpers.sync_payments(horizon_stub.admin) == 0
+
+    assert recorded_transactions(hashes) == 6
+    assert cursor(horizon_stub) == history[-1]["paging_token"]
+    for hash in hashes:
+        assert pending_operations(hash) == 0
+        assert helpers.get_submission(hash)["status"] == "successful"
+
+
+def test_redelivered_payment_is_not_recorded_twice(horizon_stub):
+    hashes = replay_history(horizon_stub, 2)
+    helpers.sync_payments(horizon_stub.admin)
+
+    assert helpers.ingest_payments(f"payments:{horizon_stub.admin}", [horizon_stub.history[0]]) == 0
+    assert recorded_transactions(hashes) == 2
+
+    # The cursor never moves back to the re-delivered payment
+    assert cursor(horizon_stub) == horizon_stub.history[-1]["paging_token"]
+
+
+def test_foreign_and_failed_payments_are_skipped(horizon_stub):
+    failed_hash = build_donation(horizon_stub)
+    successful_hash = build_donation(horizon_stub)
+    horizon_stub.history = [
+        payment_record(horizon_stub, Keypair.random().public_key, 1000, type="create_account"),
+        payment_record(horizon_stub, Keypair.random().public_key, 1001),
+        payment_record(horizon_stub, failed_hash, 1002, successful=False),
+        payment_record(horizon_stub, successful_hash, 1003),
+    ]
+
+    assert helpers.sync_payments(horizon_stub.admin) == 1
+    assert recorded_transactions([failed_hash]) == 0
+    assert recorded_transactions([successful_hash]) == 1
+
+    # The failed donation can still be submitted again
+    assert pending_operations(failed_hash) == 1
+    assert cursor(horizon_stub) == "1003"
+
+
+def test_follow_payments_streams_after_catching_up(horizon_stub):
+    hashes = replay_history(horizon_stub, 2)
+    live_hashes = [build_donation(horizon_stub) for _ in range(2)]
+
+    # After reconnecting, the stream re-delivers a payment already processed
+    horizon_stub.live = [
+        payment_record(horizon_stub, live_hashes[0], 2000),
+        dict(horizon_stub.history[0]),
+        payment_record(horizon_stub, live_hashes[1], 2001),
+    ]
+    horizon_stub.disconnect = StopFollowing()
+
+    with pytest.raises(StopFollowing):
+        helpers.follow_payments(horizon_stub.admin)
+
+    assert recorded_transactions(hashes + live_hashes) == 4
+    assert cursor(horizon_stub) == "2001"
@@ -0,0 +1,192 @@
+import pytest
+
+from stellar_sdk import Keypair, Network, TransactionEnvelope
+
+import config
+import helpers
+
+# Projects of the database copy waiting to be funded
+FUND_PROJECT_IDS = (23, 24)
+
+
+def build_fund(horizon_stub, project_ids=FUND_PROJECT_IDS):
+    """
+    Builds an admin batch funding each project's owner.
+
+    Returns:
+        list: the hashes of the batch's transactions.
+    """
+    operations = [{"project_id": project_id, "amount": 10, "destination_account": horizon_stub.create_account()}
+                  for project_id in project_ids]
+    return [helpers.transaction_hash(transaction) for transaction in helpers.build_payment_transaction(operations, "fund")]
+
+
+def run_sql(query, params=()):
+    """
+    Runs a query on its own connection, bypassing the helpers (and their cache).
+
+    Returns:
+        list: the fetched rows.
+    """
+    conn = config.get_db_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def statuses(project_ids=FUND_PROJECT_IDS):
+    placeholders = ", ".join("?" * len(project_ids))
+    return [row["status"] for row in run_sql(f"SELECT status FROM projects WHERE id IN ({placeholders}) ORDER BY id", project_ids)]
+
+
+def ledger_rows(hashes):
+    placeholders = ", ".join("?" * len(hashes))
+    return run_sql(f"SELECT * FROM transactions WHERE hash IN ({placeholders}) ORDER BY op_index", tuple(hashes))
+
+
+def pending_rows(hashes):
+    placeholders = ", ".join("?" * len(hashes))
+    return run_sql(f"SELECT * FROM pending_operations WHERE transaction_hash IN ({placeholders})", tuple(hashes))
+
+
+""" ATOMIC WRITE """
+
+def test_transaction_is_recorded_with_its_project_statuses(horizon_stub):
+    [hash] = build_fund(horizon_stub)
+
+    helpers.insert_transaction_into_database(hash)
+
+    assert len(ledger_rows([hash])) == 2
+    assert statuses() == ["successful", "successful"]
+    assert pending_rows([hash]) == []
+
+
+def test_statuses_are_set_within_the_write(horizon_stub, monkeypatch):
+    [hash] = build_fund(horizon_stub)
+
+    # A read failing outside the write (fetch_query returns no rows on errors) can't leave the projects payable
+    monkeypatch.setattr(helpers, "fetch_query", lambda *args, **kwargs: [])
+    helpers.insert_transaction_into_database(hash)
+
+    assert len(ledger_rows([hash])) == 2
+    assert statuses() == ["successful", "successful"]
+
+
+def test_failed_write_records_nothing(horizon_stub):
+    [hash] = build_fund(horizon_stub)
+
+    # The ledger rows and statuses are written before the pending operations are cleared, which then fails
+    run_sql("""
+        CREATE TRIGGER fail_clearing_pending_operations BEFORE DELETE ON pending_operations
+        BEGIN SELECT RAISE(ABORT, 'disk I/O error'); END
+    """)
+    with pytest.raises(Exception, match="disk I/O error"):
+        helpers.insert_transaction_into_database(hash)
+
+    assert ledger_rows([hash]) == []
+    assert statuses() == ["fund", "fund"]
+    assert len(pending_rows([hash])) == 2
+
+
+def test_recording_twice_writes_nothing(horizon_stub):
+    [hash] = build_fund(horizon_stub)
+    helpers.insert_transaction_into_database(hash)
+
+    # The admin reopens the project meanwhile: a retried recording must not settle it again
+    run_sql("UPDATE projects SET status = 'fund' WHERE id = ?", (FUND_PROJECT_IDS[0],))
+    helpers.insert_transaction_into_database(hash)
+
+    assert len(ledger_rows([hash])) == 2
+    assert statuses() == ["fund", "successful"]
+
+
+""" SPLIT BATCHES """
+
+def transaction_of(transaction_xdr):
+    return TransactionEnvelope.from_xdr(transaction_xdr, Network.TESTNET_NETWORK_PASSPHRASE).transaction
+
+
+def build_refund(horizon_stub, donors_count):
+    """
+    Builds an admin batch refunding a new donor on each project for every donor.
+
+    Returns:
+        list: the batch's transactions in XDR format.
+    """
+    operations = [{"project_id": project_id, "amount": 1, "destination_account": horizon_stub.create_account()}
+                  for project_id in FUND_PROJECT_IDS for _ in range(donors_count)]
+    return helpers.build_payment_transaction(operations, "refund")
+
+
+def test_large_batch_is_split_into_consecutive_transactions(horizon_stub):
+    transactions = build_refund(horizon_stub, 75)
+
+    assert [len(transaction_of(transaction).operations) for transaction in transactions] == [100, 50]
+    assert [transaction_of(transaction).sequence for transaction in transactions] == [1001, 1002]
+
+    hashes = [helpers.transaction_hash(transaction) for transaction in transactions]
+    assert len(pending_rows(hashes)) == 150
+    assert len({row["batch_id"] for row in pending_rows(hashes)}) == 1
+
+
+def test_project_is_settled_by_the_last_transaction_of_its_batch(horizon_stub):
+    first_hash, last_hash = [helpers.transaction_hash(transaction) for transaction in build_refund(horizon_stub, 75)]
+
+    # Project 24's refunds span both transactions, project 23's are all in the first one
+    helpers.insert_transaction_into_database(first_hash)
+    assert statuses() == ["unsuccessful", "fund"]
+
+    helpers.insert_transaction_into_database(last_hash)
+    assert statuses() == ["unsuccessful", "unsuccessful"]
+    assert len(ledger_rows([first_hash, last_hash])) == 150
+
+
+def test_batch_recorded_at_once_is_settled(horizon_stub):
+    hashes = [helpers.transaction_hash(transaction) for transaction in build_refund(horizon_stub, 75)]
+
+    # The ingester records every transaction of the batch in a single write
+    helpers.write_batch_query(helpers.build_ledger_statements(hashes))
+
+    assert statuses() == ["unsuccessful", "unsuccessful"]
+    assert len(ledger_rows(hashes)) == 150
+
+
+""" MERGED REFUNDS """
+
+def test_refunds_to_the_same_donor_are_merged():
+    donor, other_donor = Keypair.random().public_key, Keypair.random().public_key
+    operations = [
+        {"project_id": 23, "amount": 0.1, "destination_account": donor},
+        {"project_id": 24, "amount": 0.2, "destination_account": other_donor},
+        {"project_id": 24, "amount": 0.2, "destination_account": donor},
+    ]
+
+    payments = helpers.plan_payments(operations, "refund")
+
+    # Decimal sums: 0.1 + 0.2 is exactly 0.3 (as floats it would be 0.30000000000000004)
+    assert [(payment["destination_account"], payment["amount"]) for payment in payments] == [(donor, "0.3"), (other_donor, "0.2")]
+    assert payments[0]["operations"] == [operations[0], operations[2]]
+
+
+def test_other_payments_are_never_merged():
+    owner = Keypair.random().public_key
+    operations = [{"project_id": project_id, "amount": 10, "destination_account": owner} for project_id in FUND_PROJECT_IDS]
+
+    assert [payment["amount"] for payment in helpers.plan_payments(operations, "fund")] == ["10", "10"]
+
+
+def test_merged_refund_is_recorded_per_project(horizon_stub):
+    donor = horizon_stub.create_account()
+    operations = [{"project_id": project_id, "amount": 3, "destination_account": donor} for project_id in FUND_PROJECT_IDS]
+
+    [transaction] = helpers.build_payment_transaction(operations, "refund")
+    [payment] = transaction_of(transaction).operations
+    assert (payment.destination.account_id, payment.amount) == (donor, "6")
+
+    hash = helpers.transaction_hash(transaction)
+    helpers.insert_transaction_into_database(hash)
+    assert [(row["project_id"], row["amount"], row["public_key_receiver"]) for row in ledger_rows([hash])] == \
+        [(23, 3, donor), (24, 3, donor)]
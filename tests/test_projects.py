@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import config
+import helpers
+
+# Active project of the database copy without any donation
+PROJECT_ID = 30
+
+
+def run_sql(query, params=()):
+    conn = config.get_db_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def test_cancel_refunds_a_donation_the_cache_missed(client, horizon_stub):
+    assert helpers.search_project_by_id(PROJECT_ID)["total_donations"] == 0
+
+    # Another worker process records a donation (this process' query cache isn't told)
+    donor = horizon_stub.create_account()
+    run_sql("""
+        INSERT INTO transactions (project_id, amount, public_key_sender, public_key_receiver, hash, op_index, type, timestamp)
+        VALUES (?, 5, ?, ?, 'otherworker', 0, 'donation', ?)
+    """, (PROJECT_ID, donor, horizon_stub.admin, datetime.now()))
+    assert helpers.search_project_by_id(PROJECT_ID)["total_donations"] == 0
+
+    owner = run_sql("SELECT public_key FROM projects WHERE id = ?", (PROJECT_ID,))[0]["public_key"]
+    with client.session_transaction() as user_session:
+        user_session["public_key"] = owner
+    client.post(f"/project/{PROJECT_ID}")
+
+    assert run_sql("SELECT status FROM projects WHERE id = ?", (PROJECT_ID,))[0]["status"] == "refund"
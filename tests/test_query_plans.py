@@ -0,0 +1,114 @@
+import pytest
+
+from flask import Flask, session
+
+import config
+import helpers
+
+
+@pytest.fixture
+def executed_queries(database, monkeypatch):
+    """
+    Records every query run through fetch_query, so the plans checked are the ones the helpers actually execute.
+
+    Returns:
+        list: (query, params) tuples in execution order.
+    """
+    executed = []
+    fetch_query = helpers.fetch_query
+
+    def recording_fetch_query(query, params=(), cache=True):
+        executed.append((query, params if isinstance(params, tuple) else (params,)))
+        return fetch_query(query, params, cache)
+
+    monkeypatch.setattr(helpers, "fetch_query", recording_fetch_query)
+    return executed
+
+
+@pytest.fixture
+def user_session():
+    """
+    Runs the test inside a request of a logged in user.
+    """
+    app = Flask(__name__)
+    app.secret_key = "test"
+    with app.test_request_context():
+        session["public_key"] = "GDONOR"
+        yield
+
+
+def query_plan(query, params):
+    """
+    Returns the EXPLAIN QUERY PLAN details of a query, one string per step.
+    """
+    conn = config.get_db_connection()
+    try:
+        return [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+    finally:
+        conn.close()
+
+
+def assert_uses_index(plan, table, index):
+    """
+    Asserts the table is searched through the index (covering or not) and never scanned.
+    """
+    steps = [step for step in plan if step == f"SCAN {table}" or step.startswith((f"SEARCH {table} ", f"SCAN {table} "))]
+    assert steps, plan
+    for step in steps:
+        assert step.startswith(f"SEARCH {table} USING ") and " INDEX " in step, plan
+    assert any(f"INDEX {index} " in step for step in steps), plan
+
+
+def test_total_donations_never_aggregate_transactions(executed_queries):
+    helpers.calculate_total_donations([{"project_id": 13}, {"project_id": 16}])
+    helpers.verify_project_totals()
+    (totals_query, totals_params), (verify_query, verify_params) = executed_queries
+
+    # Listings read the stored total of their projects only, the full aggregate (used to check them) searches only donations
+    assert "transactions" not in totals_query
+    assert query_plan(totals_query, totals_params) == ["SEARCH project_totals USING INTEGER PRIMARY KEY (rowid=?)"]
+    plan = query_plan(verify_query, verify_params)
+
+    assert_uses_index(plan, "transactions", "idx_transactions_type_project_amount")
+
+
+def test_supported_projects_use_sender_index(executed_queries, user_session):
+    helpers.search_supported_projects()
+    plan = query_plan(*executed_queries[-1])
+
+    assert_uses_index(plan, "t", "idx_transactions_sender_type_project")
+    assert any(step.startswith("SEARCH t USING COVERING INDEX") for step in plan), plan
+
+
+def test_donations_history_uses_sender_index(executed_queries, user_session):
+    helpers.search_donations_history()
+    plan = query_plan(*executed_queries[-1])
+
+    assert_uses_index(plan, "t", "idx_transactions_sender_type_project")
+
+
+def test_refund_operations_use_type_project_index(executed_queries):
+    helpers.search_refund_operations([{"project_id": 1}, {"project_id": 2}])
+    plan = query_plan(*executed_queries[-1])
+
+    assert_uses_index(plan, "t", "idx_transactions_type_project_amount")
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"status": "active"}, "idx_projects_status_created_at"),
+    ({"status": "active", "cursor": 3, "limit": 12}, "idx_projects_status_created_at"),
+    ({"owner": "GOWNER"}, "idx_projects_public_key"),
+])
+def test_project_listings_use_projects_indexes(executed_queries, filters, index):
+    helpers.search_projects(**filters)
+    plan = query_plan(*executed_queries[-1])
+
+    assert_uses_index(plan, "p", index)
+
+
+def test_status_listing_is_read_in_order(executed_queries):
+    helpers.search_projects(status="active")
+    plan = query_plan(*executed_queries[-1])
+
+    # Newest first straight from (status, created_at), without sorting the projects
+    assert not any("TEMP B-TREE FOR ORDER BY" in step for step in plan), plan
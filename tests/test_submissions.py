@@ -0,0 +1,280 @@
+import sqlite3
+import threading
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from flask import Flask, session
+
+import config
+import db
+import helpers
+
+# Projects of the database copy waiting to be funded, and still receiving donations
+FUND_PROJECT_IDS = (23, 24)
+ACTIVE_PROJECT_ID = 13
+
+
+def build_fund_batch(horizon_stub, operations_count=101):
+    """
+    Builds an admin batch funding new owner accounts, split into two transactions by default.
+
+    Returns:
+        list: the batch's transactions in XDR format, in signing order.
+    """
+    operations = [{"project_id": FUND_PROJECT_IDS[i % 2], "amount": 1, "destination_account": horizon_stub.create_account()}
+                  for i in range(operations_count)]
+    return helpers.build_payment_transaction(operations, "fund")
+
+
+def enqueue(horizon_stub, signed_transactions):
+    """
+    Queues a batch as /send_transaction does for the admin.
+
+    Returns:
+        str: the submission batch id.
+    """
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.teardown_appcontext(db.close_db)
+    with app.test_request_context():
+        session["public_key"] = horizon_stub.admin
+        return helpers.enqueue_submission(signed_transactions)
+
+
+def run_submission_queue():
+    """
+    Does the work of a submission worker thread until the queue is empty.
+    """
+    while not helpers.submission_queue.empty():
+        helpers.process_submission_batch(helpers.submission_queue.get_nowait())
+
+
+def run_sql(query, params=()):
+    conn = config.get_db_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def make_stale(batch_id):
+    """
+    Makes a batch look like no worker moved it forward for longer than SUBMISSION_TIMEOUT.
+    """
+    updated_at = datetime.now() - timedelta(seconds=config.SUBMISSION_TIMEOUT + 1)
+    run_sql("UPDATE submission_batches SET updated_at = ? WHERE id = ?", (updated_at, batch_id))
+
+
+def recorded_operations(signed_transactions):
+    hashes = [helpers.transaction_hash(transaction) for transaction in signed_transactions]
+    placeholders = ", ".join("?" * len(hashes))
+    return run_sql(f"SELECT COUNT(*) AS count FROM transactions WHERE hash IN ({placeholders})", tuple(hashes))[0]["count"]
+
+
+def test_batch_is_submitted_in_order(horizon_stub):
+    transactions = build_fund_batch(horizon_stub)
+    batch_id = enqueue(horizon_stub, transactions)
+    assert helpers.get_submission_batch(batch_id)["status"] == "queued"
+
+    run_submission_queue()
+
+    batch = helpers.get_submission_batch(batch_id)
+    assert batch["status"] == "successful"
+    assert batch["hashes"] == horizon_stub.submitted == [helpers.transaction_hash(transaction) for transaction in transactions]
+    assert recorded_operations(transactions) == 101
+
+
+def test_bad_sequence_fails_the_batch(horizon_stub):
+    transactions = build_fund_batch(horizon_stub)
+
+    # The admin account was used outside the app after the batch was built
+    horizon_stub.accounts[horizon_stub.admin] += 1
+    batch_id = enqueue(horizon_stub, transactions)
+    run_submission_queue()
+
+    batch = helpers.get_submission_batch(batch_id)
+    assert batch["status"] == "failed"
+    assert batch["error"].startswith("Transaction 1 of 2 failed")
+    assert batch["hashes"] == []
+
+    # The following transaction depends on the first one's sequence number, so it isn't submitted
+    assert len(horizon_stub.submitted) == 1
+    assert recorded_operations(transactions) == 0
+    assert run_sql("SELECT * FROM account_sequences WHERE account_id = ?", (horizon_stub.admin,)) == []
+
+
+def test_timed_out_submission_can_be_sent_again(horizon_stub):
+    transactions = build_fund_batch(horizon_stub)
+    horizon_stub.timeouts.add(helpers.transaction_hash(transactions[1]))
+    batch_id = enqueue(horizon_stub, transactions)
+    run_submission_queue()
+
+    batch = helpers.get_submission_batch(batch_id)
+    assert batch["status"] == "failed"
+    assert len(batch["hashes"]) == 1
+
+    # Sending the whole batch again only submits the transaction that didn't make it
+    horizon_stub.timeouts.clear()
+    batch_id = enqueue(horizon_stub, transactions)
+    run_submission_queue()
+
+    assert helpers.get_submission_batch(batch_id)["status"] == "successful"
+    assert len(horizon_stub.submitted) == 3
+    assert recorded_operations(transactions) == 101
+
+
+def test_unfinished_batches_resume_after_a_restart(horizon_stub, monkeypatch):
+    donor = horizon_stub.create_account()
+    operations = [{"project_id": ACTIVE_PROJECT_ID, "amount": 5, "source_account": donor,
+                   "destination_account": horizon_stub.admin}]
+    queued = helpers.build_payment_transaction(operations, "donation")
+    queued_id = enqueue(horizon_stub, queued)
+    helpers.submission_queue.get_nowait()
+
+    # The first transaction of another batch was submitted when its worker process stopped
+    interrupted = build_fund_batch(horizon_stub)
+    helpers.submit_payment_transaction(interrupted[0])
+    interrupted_id = enqueue(horizon_stub, interrupted)
+    helpers.submission_queue.get_nowait()
+    run_sql("UPDATE submission_batches SET status = 'submitting', submitted = 1 WHERE id = ?", (interrupted_id,))
+    make_stale(interrupted_id)
+
+    # A new worker process queues them again (no threads here, the test does their work)
+    monkeypatch.setattr(helpers, "SUBMISSION_WORKERS", 0)
+    monkeypatch.setattr(helpers, "submission_workers_pid", None)
+    helpers.start_submission_workers()
+    run_submission_queue()
+
+    assert helpers.get_submission_batch(queued_id)["status"] == "successful"
+    assert helpers.get_submission_batch(interrupted_id)["status"] == "successful"
+    assert horizon_stub.submitted.count(helpers.transaction_hash(interrupted[0])) == 1
+    assert recorded_operations(queued + interrupted) == 102
+
+
+def test_stale_batch_is_failed_and_never_submitted(horizon_stub):
+    batch_id = enqueue(horizon_stub, build_fund_batch(horizon_stub, 2))
+    make_stale(batch_id)
+
+    assert helpers.get_submission_batch(batch_id)["status"] == "failed"
+
+    run_submission_queue()
+    assert helpers.get_submission_batch(batch_id)["status"] == "failed"
+    assert horizon_stub.submitted == []
+
+
+def test_slow_worker_stops_once_its_batch_timed_out(horizon_stub, monkeypatch):
+    transactions = build_fund_batch(horizon_stub)
+    batch_id = enqueue(horizon_stub, transactions)
+    submit_payment_transaction = helpers.submit_payment_transaction
+
+    # The first submission takes so long that the client's poll fails the batch meanwhile
+    def slow_submit_payment_transaction(signed_transaction):
+        hash = submit_payment_transaction(signed_transaction)
+        make_stale(batch_id)
+        assert helpers.get_submission_batch(batch_id)["status"] == "failed"
+        return hash
+
+    monkeypatch.setattr(helpers, "submit_payment_transaction", slow_submit_payment_transaction)
+    run_submission_queue()
+
+    batch = helpers.get_submission_batch(batch_id)
+    assert batch["status"] == "failed"
+    assert batch["error"].startswith("Timed out")
+    assert len(horizon_stub.submitted) == 1
+
+
+def test_worker_threads_do_not_wait_for_the_requests_pool(horizon_stub, monkeypatch):
+    batch_id = enqueue(horizon_stub, build_fund_batch(horizon_stub, 2))
+
+    # Requests hold every pooled connection (e.g. while waiting for Horizon)
+    monkeypatch.setattr(db, "DB_POOL_TIMEOUT", 0.1)
+    held = [db.acquire_connection() for _ in range(config.DB_POOL_SIZE)]
+    try:
+        worker = threading.Thread(target=db.own_connection(helpers.process_submission_batch), args=(batch_id,))
+        worker.start()
+        worker.join()
+    finally:
+        for conn in held:
+            db.release_connection(conn)
+
+    assert helpers.get_submission_batch(batch_id)["status"] == "successful"
+
+
+""" API """
+
+def test_api_follows_a_submission(client, horizon_stub):
+    transactions = build_fund_batch(horizon_stub)
+    with client.session_transaction() as user_session:
+        user_session["public_key"] = horizon_stub.admin
+
+    response = client.post("/send_transaction", json=transactions)
+    assert response.status_code == 202
+    submission_id = response.get_json()["submission_id"]
+    assert client.get(f"/api/submissions/{submission_id}").get_json()["status"] == "queued"
+
+    run_submission_queue()
+
+    submission = client.get(f"/api/submissions/{submission_id}").get_json()
+    assert submission["status"] == "successful"
+    assert submission["hashes"] == horizon_stub.submitted
+    assert submission["error"] is None
+
+    # Other users can't follow it
+    with client.session_transaction() as user_session:
+        user_session["public_key"] = horizon_stub.create_account()
+    assert client.get(f"/api/submissions/{submission_id}").status_code == 404
+
+
+""" DEDUPLICATION """
+
+def test_repeated_submission_is_answered_from_the_registry(horizon_stub):
+    [transaction] = build_fund_batch(horizon_stub, 2)
+
+    assert helpers.submit_payment_transaction(transaction) == helpers.submit_payment_transaction(transaction)
+    assert len(horizon_stub.submitted) == 1
+    assert recorded_operations([transaction]) == 2
+
+
+def test_concurrent_submissions_reach_horizon_once(horizon_stub):
+    [transaction] = build_fund_batch(horizon_stub, 2)
+
+    # A double click: the second request arrives while the first one waits for Horizon
+    horizon_stub.latency = 0.2
+    results = []
+    requests = [threading.Thread(target=lambda: results.append(helpers.submit_payment_transaction(transaction)))
+                for _ in range(2)]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+
+    assert results == [helpers.transaction_hash(transaction)] * 2
+    assert len(horizon_stub.submitted) == 1
+    assert recorded_operations([transaction]) == 2
+
+
+def test_operations_are_recorded_once(horizon_stub):
+    [transaction] = build_fund_batch(horizon_stub, 2)
+    hash = helpers.transaction_hash(transaction)
+    pending_operations = run_sql("SELECT * FROM pending_operations WHERE transaction_hash = ? ORDER BY id", (hash,))
+    helpers.insert_transaction_into_database(hash)
+
+    # The same operations pending again (e.g. restored from a backup) are ignored by the unique (hash, op_index) index
+    columns = ("transaction_hash", "project_id", "amount", "source_account", "destination_account", "type", "batch_id",
+               "created_at")
+    for operation in pending_operations:
+        run_sql(f"INSERT INTO pending_operations ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(operation[column] for column in columns))
+    helpers.insert_transaction_into_database(hash)
+    assert recorded_operations([transaction]) == 2
+
+    with pytest.raises(sqlite3.IntegrityError):
+        run_sql("""
+            INSERT INTO transactions (project_id, amount, public_key_sender, public_key_receiver, hash, op_index, type, timestamp)
+            SELECT project_id, amount, public_key_sender, public_key_receiver, hash, op_index, type, timestamp
+            FROM transactions WHERE hash = ? AND op_index = 0
+        """, (hash,))